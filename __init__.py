@@ -8,9 +8,27 @@ This package provides functionality for:
 - Command-line interface for batch processing
 """
 
-from .depth_estimation import DepthEstimator
-from .point_cloud_generation import PointCloudGenerator
-from .sfm import SfMReconstructor
+import importlib
 
 __version__ = "0.2.0"
-__all__ = ["DepthEstimator", "PointCloudGenerator", "SfMReconstructor"]
\ No newline at end of file
+__all__ = ["DepthEstimator", "PointCloudGenerator", "SfMReconstructor"]
+
+# Submodules are imported on first attribute access (PEP 562) so that e.g.
+# SfM-only workflows don't pay for importing torch
+_LAZY_ATTRS = {
+    "DepthEstimator": ".depth_estimation",
+    "PointCloudGenerator": ".point_cloud_generation",
+    "SfMReconstructor": ".sfm",
+}
+
+
+def __getattr__(name):
+    if name in _LAZY_ATTRS:
+        value = getattr(importlib.import_module(_LAZY_ATTRS[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_ATTRS))
\ No newline at end of file
@@ -1,17 +1,83 @@
 import click
 import os
 import glob
-from src.depth_estimation import DepthEstimator
+import stat
+from itertools import combinations
+import numpy as np
+from PIL import Image
 from src.point_cloud_generation import PointCloudGenerator
-from src.sfm import SfMReconstructor
+from src.sfm import BINARY_FEATURE_TYPES, SfMReconstructor
+
+# Image extensions picked up when a directory is given as input
+IMAGE_EXTS = frozenset({'.jpg', '.jpeg', '.png'})
+
+# Characters that make glob.glob treat a string as a pattern
+GLOB_CHARS = '*?['
+
+# Maximum Hamming distance between 64-bit image hashes for two views to be
+# considered overlapping enough to be worth running SfM on
+OVERLAP_MAX_DISTANCE = 20
+
+
+def _safe_stat(path):
+    """Return os.stat(path), or None if the path doesn't exist or can't be accessed."""
+    try:
+        return os.stat(path)
+    except (OSError, ValueError):
+        return None
+
+
+def image_hash(path):
+    """Compute a 64-bit difference hash (dHash) of an image thumbnail."""
+    with Image.open(path) as img:
+        # Let the JPEG decoder downscale during decode
+        img.draft('L', (64, 64))
+        pixels = np.asarray(img.convert('L').resize((9, 8)), dtype=np.int16)
+    diff = (pixels[:, :-1] > pixels[:, 1:]).ravel()
+    return int.from_bytes(np.packbits(diff).tobytes(), 'big')
+
+
+def images_overlap(paths, max_distance=OVERLAP_MAX_DISTANCE):
+    """Return True if at least one pair of images has similar thumbnails."""
+    hashes = []
+    for path in paths:
+        try:
+            hashes.append(image_hash(path))
+        except Exception:
+            # Unreadable here doesn't mean unreadable for OpenCV; let SfM decide
+            return True
+    return any(bin(a ^ b).count('1') < max_distance for a, b in combinations(hashes, 2))
 
 @click.command(context_settings=dict(ignore_unknown_options=True, allow_extra_args=True))
 @click.option('--input', '-i', required=False, help='Path to input image or directory')
 @click.option('--output', '-o', default='output.ply', help='Path to output PLY/OBJ file')
 @click.option('--model', '-m', default='MiDaS_small', help='Model type: MiDaS_small, DPT_Large, DPT_Hybrid')
 @click.option('--sfm/--no-sfm', default=True, help='Enable/Disable SfM reconstruction')
+@click.option('--features', default='auto',
+              type=click.Choice(['auto', 'SIFT', 'ORB', 'AKAZE', 'CUDA_ORB']),
+              help='SfM feature detector (auto: SIFT; CUDA_ORB runs ORB on a CUDA device)')
+@click.option('--matcher', default='auto',
+              type=click.Choice(['auto', 'bf', 'flann', 'cascade']),
+              help='SfM feature matcher (auto: cascade for 10+ images with binary features '
+                   'such as ORB, else flann; cascade has no effect on SIFT)')
+@click.option('--device', default='auto', type=click.Choice(['auto', 'cpu', 'cuda']),
+              help='Depth estimation device (auto: CUDA when available)')
+@click.option('--precision', default='fp16', type=click.Choice(['fp16', 'bf16', 'fp32']),
+              help='Depth estimation precision (fp16 only applies on CUDA, bf16 only on CPU)')
+@click.option('--batch-size', default=4, show_default=True, type=click.IntRange(min=1),
+              help='Images per depth estimation batch when converting several images with --no-sfm')
+@click.option('--overlap-check/--no-overlap-check', default=False,
+              help='Skip SfM when no pair of input images looks similar (off by default; '
+                   'thumbnail hashes also reject rotated or shifted views SfM can handle)')
+@click.option('--feature-cache', default=None,
+              help='Directory to cache SfM features in between runs (off by default)')
+@click.option('--fast', is_flag=True,
+              help='Fast SfM: ORB features with Hamming matching (overrides --features/--matcher)')
+@click.option('--opencl', is_flag=True,
+              help='Run SfM feature extraction through OpenCL (cv2.UMat) when available')
 @click.pass_context
-def main(ctx, input, output, model, sfm):
+def main(ctx, input, output, model, sfm, features, matcher, device, precision, batch_size,
+         overlap_check, feature_cache, fast, opencl):
     """
     Convert a 2D image to a 3D point cloud.
     
@@ -22,8 +88,6 @@ def main(ctx, input, output, model, sfm):
     # If shell expands "images/*.jpg" to "images/1.jpg images/2.jpg", 
     # input will be "images/1.jpg" and the rest will be in ctx.args
     
-    input_files = []
-    
     # 1. Collect all potential input arguments
     potential_inputs = []
     if input:
@@ -31,29 +95,51 @@ def main(ctx, input, output, model, sfm):
     potential_inputs.extend(ctx.args)
     
     # 2. Process inputs (expand globs if they were passed as strings, or use direct paths)
+    # Repeated patterns on the command line are only expanded once, and each
+    # path is stat'ed at most once (the diagnostics below reuse the results)
+    glob_cache = {}
+    stat_cache = {}
+
+    def stat_path(path):
+        if path not in stat_cache:
+            stat_cache[path] = _safe_stat(path)
+        return stat_cache[path]
+
+    def expand_glob(pattern):
+        if pattern not in glob_cache:
+            glob_cache[pattern] = sorted(glob.glob(pattern))
+        return glob_cache[pattern]
+
+    # Each input is classified once as (path, kind, matched files); the
+    # diagnostics below report from this instead of re-checking the filesystem
+    classified = []
     for path_str in potential_inputs:
         # Check if it looks like a glob pattern
         if '*' in path_str or '?' in path_str:
-            expanded = sorted(glob.glob(path_str))
-            input_files.extend(expanded)
+            classified.append((path_str, 'glob', expand_glob(path_str)))
+            continue
+
+        # It's a direct path (or shell already expanded it)
+        st = stat_path(path_str)
+        if st is not None and stat.S_ISDIR(st.st_mode):
+            # Single directory pass instead of one glob per extension
+            with os.scandir(path_str) as it:
+                matched = sorted(
+                    e.path for e in it
+                    if os.path.splitext(e.name)[1].lower() in IMAGE_EXTS and e.is_file()
+                )
+            classified.append((path_str, 'dir', matched))
+        elif st is not None:
+            classified.append((path_str, 'file', [path_str]))
+        elif any(c in path_str for c in GLOB_CHARS):
+            # Might be a glob pattern (e.g. "img[0-9].jpg") that didn't match
+            # as a literal path; plain missing paths can't match anything
+            classified.append((path_str, 'glob', expand_glob(path_str)))
         else:
-            # It's a direct path (or shell already expanded it)
-            if os.path.exists(path_str):
-                # If directory, expand content
-                if os.path.isdir(path_str):
-                     input_files.extend(sorted(glob.glob(os.path.join(path_str, "*.[jJ][pP][gG]"))) + \
-                                        sorted(glob.glob(os.path.join(path_str, "*.[pP][nN][gG]"))))
-                else:
-                    input_files.append(path_str)
-            else:
-                # Might be a glob pattern that didn't match anything yet, or invalid path
-                # Try globbing just in case
-                expanded = sorted(glob.glob(path_str))
-                if expanded:
-                    input_files.extend(expanded)
+            classified.append((path_str, 'missing', []))
     
     # Remove duplicates and sort
-    input_files = sorted(list(set(input_files)))
+    input_files = sorted(dict.fromkeys(f for _, _, matched in classified for f in matched))
 
     if not input_files:
         print("Error: No input files found.")
@@ -62,11 +148,10 @@ def main(ctx, input, output, model, sfm):
              print("Please provide input via -i/--input.")
         else:
             print("\nDiagnostics:")
-            for path_str in potential_inputs:
-                if '*' in path_str or '?' in path_str:
-                    # It's a glob pattern
+            for path_str, kind, _ in classified:
+                if kind == 'glob':
                     dirname = os.path.dirname(path_str)
-                    if dirname and not os.path.exists(dirname):
+                    if dirname and stat_path(dirname) is None:
                         print(f"  [!] Directory not found: '{dirname}'")
                         print(f"      (Pattern was: '{path_str}')")
                     else:
@@ -75,10 +160,10 @@ def main(ctx, input, output, model, sfm):
                              print(f"      (Directory '{dirname}' exists)")
                         else:
                              print(f"      (Checked current directory)")
-                else:
-                    # It's a direct path
-                    if not os.path.exists(path_str):
-                        print(f"  [!] File or directory not found: '{path_str}'")
+                elif kind == 'dir':
+                    print(f"  [!] No .jpg/.jpeg/.png images in directory: '{path_str}'")
+                elif kind == 'missing':
+                    print(f"  [!] File or directory not found: '{path_str}'")
         
         print("\nExample usage:")
         print("  python cli.py -i 'images/*.jpg'")
@@ -86,10 +171,22 @@ def main(ctx, input, output, model, sfm):
         return
 
     # Try SfM if multiple images and enabled
-    if sfm and len(input_files) >= 2:
+    if sfm and len(input_files) >= 2 and overlap_check and not images_overlap(input_files):
+        print("Images appear unrelated, skipping SfM.")
+    elif sfm and len(input_files) >= 2:
         print(f"Attempting SfM reconstruction with {len(input_files)} images...")
+        if features == 'auto':
+            features = 'SIFT'
+        if matcher == 'auto':
+            # Cascade hashing only changes the index for binary descriptors
+            if len(input_files) >= 10 and features in BINARY_FEATURE_TYPES:
+                matcher = 'cascade'
+            else:
+                matcher = 'flann'
         try:
-            reconstructor = SfMReconstructor(feature_type="SIFT")
+            reconstructor = SfMReconstructor(feature_type=features, matcher_type=matcher.upper(),
+                                             cache_dir=feature_cache or None, fast_mode=fast,
+                                             use_opencl=opencl)
             result = reconstructor.reconstruct_from_images(input_files)
             
             if result["success"]:
@@ -105,11 +202,32 @@ def main(ctx, input, output, model, sfm):
             print(f"SfM error: {e}")
             print("Falling back to single-image depth estimation...")
 
+    # Imported here so SfM-only runs never load torch
+    from src.depth_estimation import DepthEstimator
+
+    # Per-image depth estimation when SfM is disabled: one point cloud per input
+    if not sfm and len(input_files) >= 2:
+        print(f"Processing {len(input_files)} images with {model} (batch size {batch_size})...")
+        estimator = DepthEstimator(model_type=model, device=device, precision=precision)
+        depth_maps = estimator.estimate_depth_batch(input_files, batch_size=batch_size)
+
+        generator = PointCloudGenerator()
+        base, ext = os.path.splitext(output)
+        succeeded = 0
+        for i, (image_path, depth_map) in enumerate(zip(input_files, depth_maps)):
+            if depth_map is None:
+                print(f"Depth estimation failed for {image_path}.")
+                continue
+            if generator.depth_to_pointcloud(depth_map, image_path, f"{base}_{i}{ext}"):
+                succeeded += 1
+        print(f"Converted {succeeded}/{len(input_files)} images.")
+        return
+
     # Fallback or Single Image Mode
     print(f"Processing {input_files[0]} with {model}...")
     
     # 1. Estimate Depth
-    estimator = DepthEstimator(model_type=model)
+    estimator = DepthEstimator(model_type=model, device=device, precision=precision)
     depth_map = estimator.estimate_depth(input_files[0])
     
     if depth_map is None:
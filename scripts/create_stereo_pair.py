@@ -9,12 +9,9 @@ def create_stereo_pair(output_dir="images"):
 
     width, height = 800, 600
     
-    # 1. Create a background with random noise for texture
-    np.random.seed(42)
-    background = np.random.randint(0, 255, (height, width), dtype=np.uint8)
-    
-    # 2. Create base image (left view)
-    img_left = cv2.cvtColor(background, cv2.COLOR_GRAY2BGR)
+    # 1. Create base image (left view) directly as BGR noise for texture
+    rng = np.random.default_rng(42)
+    img_left = rng.integers(0, 255, (height, width, 3), dtype=np.uint8)
     
     # Add some distinct shapes
     # A red square
@@ -24,14 +21,14 @@ def create_stereo_pair(output_dir="images"):
     # A blue text
     cv2.putText(img_left, "SfM Test", (300, 500), cv2.FONT_HERSHEY_SIMPLEX, 2, (255, 0, 0), 4)
 
-    # 3. Create right image (shift everything slightly to left = camera moved right)
+    # 2. Create right image (shift everything slightly to left = camera moved right)
+    # A pure integer shift is just a slice copy, no affine resampling needed
     shift = 20 # pixels
-    M = np.float32([[1, 0, -shift], [0, 1, 0]])
-    img_right = cv2.warpAffine(img_left, M, (width, height))
+    img_right = np.empty_like(img_left)
+    img_right[:, :-shift] = img_left[:, shift:]
     
     # Fill the gap on the right with noise
-    noise_strip = np.random.randint(0, 255, (height, shift, 3), dtype=np.uint8)
-    img_right[:, -shift:] = noise_strip
+    img_right[:, -shift:] = rng.integers(0, 255, (height, shift, 3), dtype=np.uint8)
 
     # Save images
     cv2.imwrite(os.path.join(output_dir, "left.png"), img_left)
@@ -8,23 +8,20 @@ def connect_to_sw():
         # Try specific version progID if generic fails, e.g. "SldWorks.Application.31" (2023)
         # But generic usually works.
         sw = win32com.client.GetActiveObject("SldWorks.Application")
-        # Ensure we get the dynamic object to allow late binding which is more flexible
-        sw = win32com.client.dynamic.Dispatch(sw)
+        # Wrap in early-bound classes generated from the typelib (cached in gen_py),
+        # so each API call is a direct Invoke instead of GetIDsOfNames + Invoke
+        sw = win32com.client.gencache.EnsureDispatch(sw)
         return sw
     except:
         try:
-            sw = win32com.client.Dispatch("SldWorks.Application")
+            sw = win32com.client.gencache.EnsureDispatch("SldWorks.Application")
             sw.Visible = True
             return sw
         except:
             print("Could not connect to SolidWorks.")
             return None
 
-def generate_part():
-    swApp = connect_to_sw()
-    if not swApp:
-        return
-
+def build_part(model):
     # Constants from OCR
     TOTAL_LENGTH = 205.0
     WIDTH = 32.0
@@ -34,21 +31,6 @@ def generate_part():
     HOLE_DIA = 14.0
     FOOT_THICKNESS = 22.0  # From "Left vertical thickness dimension: 22"
     
-    # 1. Get Active Document (Assuming user created a new part manually)
-    model = swApp.ActiveDoc
-    
-    if not model:
-        print("No active document found. Please open a new Part file in SolidWorks manually before running this script.")
-        # Try to create one last time as fallback, but don't crash if fails
-        try:
-             model = swApp.NewDocument("C:\\ProgramData\\SolidWorks\\SolidWorks 2023\\templates\\Part.prtdot", 0, 0, 0)
-        except:
-             pass
-    
-    if not model:
-        print("Error: Could not access active document.")
-        return
-
     # Set Title (Optional, might fail if not saved)
     # model.SetTitle2("Generated_Bracket")
     
@@ -207,5 +189,40 @@ def generate_part():
     
     print("Part generation logic executed.")
 
+def generate_part():
+    swApp = connect_to_sw()
+    if not swApp:
+        return
+
+    # 1. Get Active Document (Assuming user created a new part manually)
+    model = swApp.ActiveDoc
+    
+    if not model:
+        print("No active document found. Please open a new Part file in SolidWorks manually before running this script.")
+        # Try to create one last time as fallback, but don't crash if fails
+        try:
+             model = swApp.NewDocument("C:\\ProgramData\\SolidWorks\\SolidWorks 2023\\templates\\Part.prtdot", 0, 0, 0)
+        except:
+             pass
+    
+    if not model:
+        print("Error: Could not access active document.")
+        return
+
+    # Suppress per-call redraws and feature-tree refreshes while the part is
+    # built, then redraw once at the end
+    swApp.CommandInProgress = True
+    model.FeatureManager.EnableFeatureTree = False
+    model.SketchManager.AddToDB = True
+    model.SketchManager.DisplayWhenAdded = False
+    try:
+        build_part(model)
+    finally:
+        model.SketchManager.DisplayWhenAdded = True
+        model.SketchManager.AddToDB = False
+        model.FeatureManager.EnableFeatureTree = True
+        swApp.CommandInProgress = False
+        model.GraphicsRedraw2()
+
 if __name__ == "__main__":
     generate_part()
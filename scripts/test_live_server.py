@@ -1,69 +1,95 @@
+import base64
+import io
 import os
 import requests
 import time
 import uuid
 
+# 100x100 solid red JPEG used as the upload fixture (pre-encoded so the
+# script doesn't need PIL)
+_RED_JPEG = base64.b64decode(
+    b'/9j/4AAQSkZJRgABAQAAAQABAAD/2wBDAAgGBgcGBQgHBwcJCQgKDBQNDAsLDBkSEw8UHRofHh0a'
+    b'HBwgJC4nICIsIxwcKDcpLDAxNDQ0Hyc5PTgyPC4zNDL/2wBDAQkJCQwLDBgNDRgyIRwhMjIyMjIy'
+    b'MjIyMjIyMjIyMjIyMjIyMjIyMjIyMjIyMjIyMjIyMjIyMjIyMjIyMjIyMjL/wAARCABkAGQDASIA'
+    b'AhEBAxEB/8QAHwAAAQUBAQEBAQEAAAAAAAAAAAECAwQFBgcICQoL/8QAtRAAAgEDAwIEAwUFBAQA'
+    b'AAF9AQIDAAQRBRIhMUEGE1FhByJxFDKBkaEII0KxwRVS0fAkM2JyggkKFhcYGRolJicoKSo0NTY3'
+    b'ODk6Q0RFRkdISUpTVFVWV1hZWmNkZWZnaGlqc3R1dnd4eXqDhIWGh4iJipKTlJWWl5iZmqKjpKWm'
+    b'p6ipqrKztLW2t7i5usLDxMXGx8jJytLT1NXW19jZ2uHi4+Tl5ufo6erx8vP09fb3+Pn6/8QAHwEA'
+    b'AwEBAQEBAQEBAQAAAAAAAAECAwQFBgcICQoL/8QAtREAAgECBAQDBAcFBAQAAQJ3AAECAxEEBSEx'
+    b'BhJBUQdhcRMiMoEIFEKRobHBCSMzUvAVYnLRChYkNOEl8RcYGRomJygpKjU2Nzg5OkNERUZHSElK'
+    b'U1RVVldYWVpjZGVmZ2hpanN0dXZ3eHl6goOEhYaHiImKkpOUlZaXmJmaoqOkpaanqKmqsrO0tba3'
+    b'uLm6wsPExcbHyMnK0tPU1dbX2Nna4uPk5ebn6Onq8vP09fb3+Pn6/9oADAMBAAIRAxEAPwDi6KKK'
+    b'+ZP3EKKKKACiiigAooooAKKKKACiiigAooooAKKKKACiiigAooooAKKKKACiiigAooooAKKKKACi'
+    b'iigAooooAKKKKACiiigAooooAKKKKACiiigAooooAKKKKACiiigAooooAKKKKACiiigAooooAKKK'
+    b'KACiiigAooooAKKKKACiiigAooooAKKKKACiiigAooooAKKKKACiiigAooooAKKKKACiiigAoooo'
+    b'AKKKKACiiigAooooAKKKKACiiigAooooA//Z'
+)
+
 def test_full_flow():
     base_url = "http://127.0.0.1:5000"
     
     # 1. Create a dummy image
-    from PIL import Image
-    import io
-    
-    img_byte_arr = io.BytesIO()
-    image = Image.new('RGB', (100, 100), color='red')
-    image.save(img_byte_arr, format='JPEG')
-    img_byte_arr.seek(0)
+    img_byte_arr = io.BytesIO(_RED_JPEG)
     
     # 2. Upload
     print(f"Uploading file to {base_url}/api/upload...")
     files = {'files': ('test_flow.jpg', img_byte_arr, 'image/jpeg')}
+    # One session for the whole flow so the connection is kept alive across polls
     try:
-        resp = requests.post(f"{base_url}/api/upload", files=files)
-        if resp.status_code != 202:
-            print(f"Upload failed: {resp.status_code} {resp.text}")
-            return
-        
-        data = resp.json()
-        task_id = data['task_id']
-        print(f"Upload success. Task ID: {task_id}")
-        
-        # 3. Poll Status
-        print("Polling status...")
-        for _ in range(30): # Wait up to 60 seconds
-            status_resp = requests.get(f"{base_url}/api/status/{task_id}")
-            status_data = status_resp.json()
-            status = status_data['status']
-            print(f"Status: {status}")
+        with requests.Session() as session:
+            resp = session.post(f"{base_url}/api/upload", files=files)
+            if resp.status_code != 202:
+                print(f"Upload failed: {resp.status_code} {resp.text}")
+                return
             
-            if status == 'completed':
-                result_filename = status_data['result']
-                print(f"Task completed. Result file: {result_filename}")
-                
-                # 4. Download
-                download_url = f"{base_url}/api/download/{result_filename}"
-                print(f"Downloading from {download_url}...")
-                dl_resp = requests.get(download_url)
+            data = resp.json()
+            task_id = data['task_id']
+            print(f"Upload success. Task ID: {task_id}")
+            
+            # 3. Poll Status
+            # Poll quickly at first, backing off up to 5s between requests
+            print("Polling status...")
+            deadline = time.time() + 60 # Wait up to 60 seconds
+            delay = 0.25
+            while time.time() < deadline:
+                status_resp = session.get(f"{base_url}/api/status/{task_id}")
+                status_data = status_resp.json()
+                status = status_data['status']
+                print(f"Status: {status}")
                 
-                if dl_resp.status_code == 200:
-                    print(f"Download success! File size: {len(dl_resp.content)} bytes")
+                if status == 'completed':
+                    result_filename = status_data['result']
+                    print(f"Task completed. Result file: {result_filename}")
                     
-                    # Verify content (PLY header)
-                    if dl_resp.content.startswith(b"ply"):
-                        print("File content verification passed (starts with 'ply').")
+                    # 4. Download
+                    download_url = f"{base_url}/api/download/{result_filename}"
+                    print(f"Downloading from {download_url}...")
+                    # Only fetch the first bytes to check the PLY magic; the
+                    # size comes from HEAD so the full cloud is never transferred
+                    head_resp = session.head(download_url)
+                    dl_resp = session.get(download_url, headers={'Range': 'bytes=0-15'})
+                    
+                    if dl_resp.status_code in (200, 206):
+                        file_size = head_resp.headers.get('Content-Length', 'unknown')
+                        print(f"Download success! File size: {file_size} bytes")
+                        
+                        # Verify content (PLY header)
+                        if dl_resp.content.startswith(b"ply"):
+                            print("File content verification passed (starts with 'ply').")
+                        else:
+                            print("File content verification FAILED (does not start with 'ply').")
                     else:
-                        print("File content verification FAILED (does not start with 'ply').")
-                else:
-                    print(f"Download FAILED: {dl_resp.status_code}")
-                return
+                        print(f"Download FAILED: {dl_resp.status_code}")
+                    return
+                    
+                elif status == 'failed':
+                    print(f"Task failed: {status_data.get('error')}")
+                    return
                 
-            elif status == 'failed':
-                print(f"Task failed: {status_data.get('error')}")
-                return
-            
-            time.sleep(2)
-            
-        print("Timed out waiting for task completion.")
+                time.sleep(delay)
+                delay = min(delay * 1.5, 5.0)
+                
+            print("Timed out waiting for task completion.")
         
     except Exception as e:
         print(f"Test exception: {e}")
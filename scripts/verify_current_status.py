@@ -9,10 +9,24 @@ and generates a status report for Phase 1 completion.
 import os
 import sys
 import time
+import tempfile
 import cv2
 import numpy as np
 from pathlib import Path
 
+# Keep scratch files in RAM where a tmpfs is available (Linux)
+TEMP_ROOT = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+# Loaded MiDaS models keyed by model type, shared by all checks
+_estimator_cache = {}
+
+def get_estimator(model_type="MiDaS_small"):
+    """Return a DepthEstimator for model_type, loading the model only once."""
+    if model_type not in _estimator_cache:
+        from src.depth_estimation import DepthEstimator
+        _estimator_cache[model_type] = DepthEstimator(model_type=model_type)
+    return _estimator_cache[model_type]
+
 def test_module_imports():
     """Test that all modules can be imported successfully."""
     print("Testing module imports...")
@@ -30,32 +44,26 @@ def test_depth_estimation():
     """Test depth estimation functionality."""
     print("\nTesting depth estimation...")
     try:
-        from src.depth_estimation import DepthEstimator
-        
-        # Create a test image
-        test_img = np.random.randint(0, 255, (480, 640, 3), dtype=np.uint8)
-        cv2.imwrite("temp_test.jpg", test_img)
-        
-        # Test depth estimation
-        estimator = DepthEstimator(model_type="MiDaS_small")
-        start_time = time.time()
-        depth_map = estimator.estimate_depth("temp_test.jpg")
-        elapsed_time = time.time() - start_time
+        with tempfile.TemporaryDirectory(dir=TEMP_ROOT) as temp_dir:
+            # Create a test image
+            test_path = os.path.join(temp_dir, "temp_test.jpg")
+            test_img = np.random.randint(0, 255, (480, 640, 3), dtype=np.uint8)
+            cv2.imwrite(test_path, test_img)
+            
+            # Test depth estimation
+            estimator = get_estimator("MiDaS_small")
+            start_time = time.time()
+            depth_map = estimator.estimate_depth(test_path)
+            elapsed_time = time.time() - start_time
         
         if depth_map is not None:
             print(f"✅ Depth estimation successful in {elapsed_time:.2f}s")
             print(f"   - Output shape: {depth_map.shape}")
             print(f"   - Value range: [{depth_map.min():.3f}, {depth_map.max():.3f}]")
-            success = True
+            return True
         else:
             print("❌ Depth estimation failed")
-            success = False
-            
-        # Cleanup
-        if os.path.exists("temp_test.jpg"):
-            os.remove("temp_test.jpg")
-            
-        return success
+            return False
         
     except Exception as e:
         print(f"❌ Depth estimation error: {e}")
@@ -65,50 +73,47 @@ def test_point_cloud_generation():
     """Test point cloud generation functionality."""
     print("\nTesting point cloud generation...")
     try:
-        from src.depth_estimation import DepthEstimator
         from src.point_cloud_generation import PointCloudGenerator
         
-        # Create test data
-        test_img = np.random.randint(0, 255, (480, 640, 3), dtype=np.uint8)
-        cv2.imwrite("temp_test.jpg", test_img)
-        
-        # Generate depth map
-        estimator = DepthEstimator(model_type="MiDaS_small")
-        depth_map = estimator.estimate_depth("temp_test.jpg")
-        
-        if depth_map is None:
-            print("❌ Cannot test point cloud - depth estimation failed")
-            return False
+        with tempfile.TemporaryDirectory(dir=TEMP_ROOT) as temp_dir:
+            test_path = os.path.join(temp_dir, "temp_test.jpg")
+            output_path = os.path.join(temp_dir, "temp_output.ply")
+            
+            # Create test data
+            test_img = np.random.randint(0, 255, (480, 640, 3), dtype=np.uint8)
+            cv2.imwrite(test_path, test_img)
+            
+            # Generate depth map
+            estimator = get_estimator("MiDaS_small")
+            depth_map = estimator.estimate_depth(test_path)
+            
+            if depth_map is None:
+                print("❌ Cannot test point cloud - depth estimation failed")
+                return False
+                
+            # Generate point cloud from the in-memory image instead of decoding the file again
+            generator = PointCloudGenerator()
+            start_time = time.time()
+            rgb_img = cv2.cvtColor(test_img, cv2.COLOR_BGR2RGB)
+            pcd = generator.depth_to_pointcloud_from_array(depth_map, rgb_img, output_path)
+            elapsed_time = time.time() - start_time
+            
+            if pcd is None:
+                print("❌ Point cloud generation failed")
+                return False
             
-        # Generate point cloud
-        generator = PointCloudGenerator()
-        start_time = time.time()
-        pcd = generator.depth_to_pointcloud(depth_map, "temp_test.jpg", "temp_output.ply")
-        elapsed_time = time.time() - start_time
-        
-        if pcd is not None:
             print(f"✅ Point cloud generation successful in {elapsed_time:.2f}s")
             print(f"   - Vertices: {len(pcd.vertices)}")
             print(f"   - Colors: {len(pcd.colors)}")
             
             # Check output file
-            if os.path.exists("temp_output.ply"):
-                file_size = os.path.getsize("temp_output.ply")
+            if os.path.exists(output_path):
+                file_size = os.path.getsize(output_path)
                 print(f"   - Output file size: {file_size} bytes")
-                success = True
+                return True
             else:
                 print("❌ Output file not created")
-                success = False
-        else:
-            print("❌ Point cloud generation failed")
-            success = False
-            
-        # Cleanup
-        for file in ["temp_test.jpg", "temp_output.ply"]:
-            if os.path.exists(file):
-                os.remove(file)
-                
-        return success
+                return False
         
     except Exception as e:
         print(f"❌ Point cloud generation error: {e}")
@@ -141,17 +146,20 @@ def test_cli_functionality():
     """Test CLI functionality."""
     print("\nTesting CLI functionality...")
     try:
-        import subprocess
-        import sys
+        # Invoke the CLI in-process so already-imported modules are reused
+        from unittest.mock import patch
+        from click.testing import CliRunner
+        from cli import main
+        
+        runner = CliRunner()
         
         # Create test image
         test_img = np.random.randint(0, 255, (480, 640, 3), dtype=np.uint8)
         cv2.imwrite("cli_test.jpg", test_img)
         
         # Test CLI help
-        result = subprocess.run([sys.executable, "cli.py", "--help"], 
-                               capture_output=True, text=True)
-        if result.returncode == 0 and "Convert a 2D image to a 3D point cloud" in result.stdout:
+        result = runner.invoke(main, ["--help"])
+        if result.exit_code == 0 and "Convert a 2D image to a 3D point cloud" in result.output:
             print("✅ CLI help working")
         else:
             print("❌ CLI help not working")
@@ -159,17 +167,20 @@ def test_cli_functionality():
             
         # Test actual conversion (this might take time)
         print("Testing CLI conversion (this may take a moment)...")
-        result = subprocess.run([sys.executable, "cli.py", "-i", "cli_test.jpg", "-o", "cli_output.ply"], 
-                               capture_output=True, text=True, timeout=120)
+        # Reuse the already loaded model instead of letting the CLI load its own.
+        # Load it before patching: get_estimator imports DepthEstimator itself.
+        estimator = get_estimator()
+        with patch("src.depth_estimation.DepthEstimator", lambda model_type, **kwargs: estimator):
+            result = runner.invoke(main, ["-i", "cli_test.jpg", "-o", "cli_output.ply"])
         
-        if result.returncode == 0 and os.path.exists("cli_output.ply"):
+        if result.exit_code == 0 and os.path.exists("cli_output.ply"):
             file_size = os.path.getsize("cli_output.ply")
             print(f"✅ CLI conversion successful (output: {file_size} bytes)")
             success = True
         else:
-            print(f"❌ CLI conversion failed (return code: {result.returncode})")
-            if result.stderr:
-                print(f"   Error: {result.stderr[:200]}...")
+            print(f"❌ CLI conversion failed (exit code: {result.exit_code})")
+            if result.exception:
+                print(f"   Error: {str(result.exception)[:200]}...")
             success = False
             
         # Cleanup
@@ -179,9 +190,6 @@ def test_cli_functionality():
                 
         return success
         
-    except subprocess.TimeoutExpired:
-        print("❌ CLI test timed out")
-        return False
     except Exception as e:
         print(f"❌ CLI test error: {e}")
         return False
@@ -0,0 +1,88 @@
+"""
+Numeric inner loops, JIT-compiled with numba when it is installed.
+
+numba is optional: without it the same functions fall back to NumPy
+implementations with identical results.
+"""
+
+import functools
+
+import numpy as np
+
+try:
+    from numba import njit, prange
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+
+
+if HAVE_NUMBA:
+    @njit(cache=True)
+    def ratio_filter(d0: np.ndarray, d1: np.ndarray, ratio: float) -> np.ndarray:
+        """Return the indices i where d0[i] < ratio * d1[i] (Lowe's ratio test)."""
+        out = np.empty(d0.shape[0], np.int32)
+        k = 0
+        for i in range(d0.shape[0]):
+            if d0[i] < ratio * d1[i]:
+                out[k] = i
+                k += 1
+        return out[:k]
+else:
+    def ratio_filter(d0: np.ndarray, d1: np.ndarray, ratio: float) -> np.ndarray:
+        """Return the indices i where d0[i] < ratio * d1[i] (Lowe's ratio test)."""
+        return np.flatnonzero(d0 < ratio * d1).astype(np.int32)
+
+
+@functools.lru_cache(maxsize=8)
+def _ray_scales(height, width, fx, fy, cx, cy):
+    """
+    Per-column (u - cx) / fx as a (1, W) row and per-row (v - cy) / fy as an
+    (H, 1) column, cached because depth maps usually share one resolution
+    and the intrinsics are derived from it.
+    """
+    u = (np.arange(width, dtype=np.float32) - np.float32(cx)) * np.float32(1.0 / fx)
+    v = (np.arange(height, dtype=np.float32) - np.float32(cy)) * np.float32(1.0 / fy)
+    u.flags.writeable = False
+    v.flags.writeable = False
+    return u[None, :], v[:, None]
+
+
+if HAVE_NUMBA:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def backproject_depth(depth, out, fx, fy, cx, cy, eps, zmax):
+        """
+        Back-project a non-negative, disparity-like depth map into out (H*W, 3) in one
+        fused pass, with Z = 1 / max(depth + eps, 1 / zmax), X = (u - cx) * Z / fx,
+        Y = (v - cy) * Z / fy.
+        """
+        height, width = depth.shape
+        # Multiply by reciprocals instead of dividing per pixel
+        inv_fx = 1.0 / fx
+        inv_fy = 1.0 / fy
+        # Clamping the disparity before dividing caps Z at zmax without ever
+        # computing the huge values a clip afterwards would throw away
+        dmin = 1.0 / zmax
+        for v in prange(height):
+            for u in range(width):
+                z = 1.0 / max(depth[v, u] + eps, dmin)
+                i = v * width + u
+                out[i, 0] = (u - cx) * (z * inv_fx)
+                out[i, 1] = (v - cy) * (z * inv_fy)
+                out[i, 2] = z
+else:
+    def backproject_depth(depth, out, fx, fy, cx, cy, eps, zmax):
+        """
+        Back-project a non-negative, disparity-like depth map into out (H*W, 3),
+        with Z = 1 / max(depth + eps, 1 / zmax), X = (u - cx) * Z / fx, Y = (v - cy) * Z / fy.
+        """
+        height, width = depth.shape
+        # Clamp the disparity, then take the reciprocal in place
+        z = np.add(depth, eps, dtype=np.float32)
+        np.maximum(z, np.float32(1.0 / zmax), out=z)
+        np.reciprocal(z, out=z)
+        # A row and a column of ray scales; broadcasting expands them, so no
+        # full H x W index grids are built
+        u_scale, v_scale = _ray_scales(height, width, float(fx), float(fy), float(cx), float(cy))
+        out[:, 0] = (z * u_scale).ravel()
+        out[:, 1] = (z * v_scale).ravel()
+        out[:, 2] = z.ravel()
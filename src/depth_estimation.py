@@ -1,25 +1,54 @@
+import functools
 import cv2
 import torch
 import numpy as np
 from PIL import Image
 import torchvision.transforms as transforms
 
+@functools.lru_cache(maxsize=4)
+def _dummy_ramp(h, w):
+    """Diagonal gradient used as a fake depth map, cached per size (read-only)."""
+    x = np.linspace(0, 1, w, dtype=np.float32)
+    y = np.linspace(0, 1, h, dtype=np.float32)
+    ramp = (x[None, :] + y[:, None]) * np.float32(0.5)
+    ramp.setflags(write=False)
+    return ramp
+
 class DepthEstimator:
-    def __init__(self, model_type="MiDaS_small"):
+    def __init__(self, model_type="MiDaS_small", device="cpu", precision="fp32", compile_model=False):
         """
         Initialize the depth estimator with MiDaS model.
         Args:
             model_type (str): Type of MiDaS model to use. Options: "MiDaS_small", "DPT_Large", "DPT_Hybrid".
                               "MiDaS_small" is recommended for CPU inference.
+            device (str): "cpu", "cuda" or "auto" (CUDA when available). Requesting
+                          "cuda" without a usable CUDA device raises ValueError.
+            precision (str): "fp32", "fp16" or "bf16". fp16 is only applied on CUDA devices,
+                             bf16 (autocast) only on CPU, where it pays off on AVX-512/AMX hardware.
+            compile_model (bool): Compile the model with torch.compile. The first inference
+                                  is slow, so this is only worth it for long-running processes.
         """
-        self.device = torch.device("cpu")
-        print(f"Loading {model_type} model...")
+        if device == "auto":
+            device = "cuda" if torch.cuda.is_available() else "cpu"
+        elif device == "cuda" and not torch.cuda.is_available():
+            raise ValueError("CUDA device requested but torch.cuda.is_available() is False")
+        self.device = torch.device(device)
+        self.use_fp16 = precision == "fp16" and self.device.type == "cuda"
+        self.use_bf16 = precision == "bf16" and self.device.type == "cpu"
+        precision_note = " (fp16)" if self.use_fp16 else " (bf16)" if self.use_bf16 else ""
+        print(f"Loading {model_type} model on {self.device}{precision_note}...")
         
         try:
             # Load MiDaS model from torch hub
             self.model = torch.hub.load("intel-isl/MiDaS", model_type, trust_repo=True)
             self.model.to(self.device)
+            if self.use_fp16:
+                self.model.half()
             self.model.eval()
+            self.model = self.model.to(memory_format=torch.channels_last)
+            self._eager_model = self.model
+            if compile_model:
+                self.model = self._compile(self.model)
             
             # Load transforms
             midas_transforms = torch.hub.load("intel-isl/MiDaS", "transforms", trust_repo=True)
@@ -48,37 +77,118 @@ class DepthEstimator:
             
             img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
             if self.model is None:
-                # Return a dummy depth map (gradient)
+                # Return a dummy depth map (gradient); copied so callers get a
+                # writable array, as with real inference
                 h, w = img.shape[:2]
-                x = np.linspace(0, 1, w)
-                y = np.linspace(0, 1, h)
-                xv, yv = np.meshgrid(x, y)
-                return (xv + yv) / 2.0
+                return _dummy_ramp(h, w).copy()
 
-            # Transform input
-            input_batch = self.transform(img).to(self.device)
-            
-            # Predict
-            with torch.no_grad():
-                prediction = self.model(input_batch)
-                
-                # Resize to original resolution
-                prediction = torch.nn.functional.interpolate(
-                    prediction.unsqueeze(1),
-                    size=img.shape[:2],
-                    mode="bicubic",
-                    align_corners=False,
-                ).squeeze()
-            
-            depth_map = prediction.cpu().numpy()
-            
-            # Normalize depth map to 0-1 range for visualization/processing
-            depth_min = depth_map.min()
-            depth_max = depth_map.max()
-            depth_map_normalized = (depth_map - depth_min) / (depth_max - depth_min)
+            # Transform input and predict
+            prediction = self._forward(self.transform(img))
             
-            return depth_map_normalized
+            return self._postprocess(prediction[0], img.shape[:2])
             
         except Exception as e:
             print(f"Error estimating depth: {e}")
             return None
+
+    def estimate_depth_batch(self, image_paths, batch_size=4):
+        """
+        Estimate depth maps for several images, running them through the model in batches.
+        Args:
+            image_paths (list[str]): Paths to the input images.
+            batch_size (int): Maximum number of images per forward pass.
+        Returns:
+            list: One normalized depth map per input path (None where estimation failed).
+        """
+        if batch_size < 1:
+            raise ValueError(f"batch_size must be at least 1, got {batch_size}")
+        if self.model is None:
+            return [self.estimate_depth(path) for path in image_paths]
+
+        results = [None] * len(image_paths)
+
+        # Transformed tensors depend on the input aspect ratio, so only
+        # images with the same tensor shape can be stacked into one batch
+        groups = {}
+        for i, path in enumerate(image_paths):
+            # A bad image only fails its own slot, as with estimate_depth
+            try:
+                img = cv2.imread(path)
+                if img is None:
+                    raise ValueError(f"Could not read image at {path}")
+                img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+                tensor = self.transform(img)
+            except Exception as e:
+                print(f"Error estimating depth: {e}")
+                continue
+            groups.setdefault(tuple(tensor.shape), []).append((i, img.shape[:2], tensor))
+
+        for group in groups.values():
+            for start in range(0, len(group), batch_size):
+                chunk = group[start:start + batch_size]
+                try:
+                    predictions = self._forward(torch.cat([tensor for _, _, tensor in chunk]))
+                    for (i, size, _), prediction in zip(chunk, predictions):
+                        results[i] = self._postprocess(prediction, size)
+                except Exception as e:
+                    print(f"Error estimating depth: {e}")
+
+        return results
+
+    @staticmethod
+    def _compile(model):
+        """Compile the model with torch.compile if this torch version supports it."""
+        if not hasattr(torch, "compile"):
+            print("Warning: torch.compile is not available, running the model eagerly.")
+            return model
+        try:
+            return torch.compile(model)
+        except Exception as e:
+            print(f"Warning: torch.compile failed, running the model eagerly: {e}")
+            return model
+
+    def _forward(self, input_batch):
+        """
+        Run the model on a batch of transformed images.
+        Args:
+            input_batch (torch.Tensor): Input tensor (B, C, H, W).
+        Returns:
+            torch.Tensor: Float32 predictions (B, H, W).
+        """
+        input_batch = input_batch.to(self.device, memory_format=torch.channels_last)
+        if self.use_fp16:
+            input_batch = input_batch.half()
+        
+        try:
+            with torch.inference_mode(), torch.autocast("cpu", dtype=torch.bfloat16, enabled=self.use_bf16):
+                return self.model(input_batch).float()
+        except Exception as e:
+            if self.model is self._eager_model:
+                raise
+            # Compilation happens lazily on the first call; fall back to eager mode
+            print(f"Warning: Compiled model failed, running the model eagerly: {e}")
+            self.model = self._eager_model
+            return self._forward(input_batch)
+
+    def _postprocess(self, prediction, size):
+        """
+        Resize a single (H, W) model prediction to the original resolution and normalize it.
+        Args:
+            prediction (torch.Tensor): Raw model output for one image.
+            size (tuple): Target (height, width).
+        Returns:
+            numpy.ndarray: Depth map normalized to [0, 1].
+        """
+        # Resize to original resolution (OpenCV's SIMD bilinear resize is much
+        # cheaper than torch's CPU bicubic and plenty for a MiDaS depth map)
+        depth_map = prediction.cpu().numpy()
+        depth_map = cv2.resize(depth_map, (size[1], size[0]), interpolation=cv2.INTER_LINEAR)
+        
+        # Normalize depth map to 0-1 range for visualization/processing, in place
+        # (depth_map is a fresh array from cv2.resize)
+        depth_min = depth_map.min()
+        depth_max = depth_map.max()
+        depth_map -= depth_min
+        depth_map *= np.float32(1.0 / (depth_max - depth_min + 1e-12))
+        
+        return depth_map
@@ -1,8 +1,11 @@
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import logging
 import time
 import json
+import orjson
 from typing import Dict, Any, Optional
 
 # Configure logging
@@ -16,6 +19,14 @@ logging.basicConfig(
 )
 logger = logging.getLogger("CyberIndustrialDesign")
 
+def _format_for_log(data: Any) -> str:
+    """Pretty-print data for the log; a formatting failure never fails the call."""
+    try:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS).decode()
+    except TypeError:
+        # orjson is stricter than json (e.g. integers wider than 64 bits)
+        return json.dumps(data, indent=2, default=str)
+
 class CyberIndustrialDesignClient:
     """
     Client for the Cyber Industrial Design Skill Module.
@@ -26,6 +37,17 @@ class CyberIndustrialDesignClient:
         self.api_url = api_url.rstrip('/')
         self.auth_token = auth_token
         self.session = requests.Session()
+        # Keep connections alive and pooled across calls. Only failed connection
+        # attempts are retried: /generate is a non-idempotent POST, so a request
+        # that may have reached the server (read errors, 5xx) is never replayed
+        adapter = HTTPAdapter(
+            pool_connections=10,
+            pool_maxsize=100,
+            max_retries=Retry(total=3, connect=3, read=0, status=0, backoff_factor=0.3)
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers["Connection"] = "keep-alive"
         if auth_token:
             self.session.headers.update({"Authorization": f"Bearer {auth_token}"})
             
@@ -61,7 +83,8 @@ class CyberIndustrialDesignClient:
         logger.info(f"Calling Cyber Industrial Design Module...")
         logger.info(f"Endpoint: {self.api_url}/generate")
         logger.info(f"Timeout: {timeout}s")
-        logger.info(f"Request Data: {json.dumps(request_data, indent=2)}")
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("Request Data: %s", _format_for_log(request_data))
         
         try:
             # 2. API Call (Simulated for demonstration if URL is placeholder)
@@ -78,7 +101,8 @@ class CyberIndustrialDesignClient:
             else:
                 response = self.session.post(
                     f"{self.api_url}/generate",
-                    json=request_data,
+                    data=orjson.dumps(request_data, option=orjson.OPT_NON_STR_KEYS),
+                    headers={"Content-Type": "application/json"},
                     timeout=timeout
                 )
                 status_code = response.status_code
@@ -91,7 +115,8 @@ class CyberIndustrialDesignClient:
             duration = time.time() - start_time
             logger.info(f"API Call Completed in {duration:.2f}s")
             logger.info(f"Status Code: {status_code}")
-            logger.info(f"Response Data: {json.dumps(response_data, indent=2)}")
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("Response Data: %s", _format_for_log(response_data))
             
             if status_code != 200:
                 logger.error(f"API returned error status: {status_code}")
@@ -1,32 +1,142 @@
 import numpy as np
-import trimesh
 import cv2
 
+from ._fast import backproject_depth
+
+# Back-projection runs at no more than this height (and never above the depth
+# map's resolution, which is all the detail MiDaS actually provides)
+MAX_BACKPROJECT_HEIGHT = 480
+
+# Clouds denser than this are randomly subsampled before export; more points
+# aren't visibly better in the web viewer but make files much bigger. Sized so
+# a back-projection up to 16:9 is exported whole and only much wider images
+# (e.g. panoramas) pay for subsampling
+MAX_EXPORT_POINTS = MAX_BACKPROJECT_HEIGHT * MAX_BACKPROJECT_HEIGHT * 16 // 9
+
+# imread flags that let the decoder produce a 1/2, 1/4 or 1/8 scale image
+# directly (for JPEG during the IDCT), coarsest first
+_REDUCED_COLOR_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+def _imread_for_depth(image_path, depth_shape):
+    """
+    Read a BGR image at the coarsest reduced scale that still covers the
+    back-projection resolution. Assumes the image is the depth map's size,
+    which is what DepthEstimator.estimate_depth returns.
+    """
+    target_h = min(depth_shape[0], MAX_BACKPROJECT_HEIGHT)
+    for factor, flag in _REDUCED_COLOR_FLAGS:
+        if depth_shape[0] // factor >= target_h:
+            img = cv2.imread(image_path, flag)
+            # The image was smaller than the depth map after all; decode it in full
+            if img is not None and img.shape[0] < target_h:
+                break
+            return img
+    return cv2.imread(image_path)
+
+# Vertex layout written by write_ply: float32 XYZ followed by uint8 RGB
+PLY_VERTEX_DTYPE = np.dtype([
+    ("x", "<f4"), ("y", "<f4"), ("z", "<f4"),
+    ("red", "u1"), ("green", "u1"), ("blue", "u1"),
+])
+
+def write_ply(output_path, vertices, colors):
+    """
+    Write a colored point cloud as a binary little-endian PLY file.
+    Much faster than trimesh's exporter for large clouds: the vertex data is
+    packed into one structured array and written with a single call.
+    Args:
+        output_path (str): Path of the .ply file to write.
+        vertices (numpy.ndarray): Point coordinates (N, 3).
+        colors (numpy.ndarray): RGB (or RGBA, alpha is dropped) colors (N, 3+), uint8.
+    """
+    vertices = np.asarray(vertices)
+    colors = np.asarray(colors)
+    data = np.empty(len(vertices), dtype=PLY_VERTEX_DTYPE)
+    data["x"] = vertices[:, 0]
+    data["y"] = vertices[:, 1]
+    data["z"] = vertices[:, 2]
+    data["red"] = colors[:, 0]
+    data["green"] = colors[:, 1]
+    data["blue"] = colors[:, 2]
+
+    header = (
+        "ply\n"
+        "format binary_little_endian 1.0\n"
+        f"element vertex {len(data)}\n"
+        "property float x\n"
+        "property float y\n"
+        "property float z\n"
+        "property uchar red\n"
+        "property uchar green\n"
+        "property uchar blue\n"
+        "end_header\n"
+    )
+    with open(output_path, "wb") as f:
+        f.write(header.encode("ascii"))
+        data.tofile(f)
+
 class PointCloudGenerator:
     def __init__(self):
         pass
 
-    def depth_to_pointcloud(self, depth_map, rgb_image_path, output_path="output.ply"):
+    def depth_to_pointcloud(self, depth_map, rgb_image_path, output_path="output.ply",
+                            max_points=MAX_EXPORT_POINTS):
         """
         Convert depth map and RGB image to a colored point cloud.
         Args:
             depth_map (numpy.ndarray): Normalized depth map (H, W).
             rgb_image_path (str): Path to the RGB image.
             output_path (str): Path to save the point cloud (.ply or .obj).
+            max_points (int): Subsample to at most this many points (None keeps all).
         Returns:
             trimesh.PointCloud: The generated point cloud object.
         """
         try:
             # Read RGB image
-            rgb_img = cv2.imread(rgb_image_path)
+            rgb_img = _imread_for_depth(rgb_image_path, depth_map.shape)
             if rgb_img is None:
                 raise ValueError(f"Could not read image at {rgb_image_path}")
             
-            rgb_img = cv2.cvtColor(rgb_img, cv2.COLOR_BGR2RGB)
+            # BGR -> RGB as a view; no full-image copy is made for the channel swap
+            rgb_img = rgb_img[..., ::-1]
+        except Exception as e:
+            print(f"Error generating point cloud: {e}")
+            return None
+        
+        return self.depth_to_pointcloud_from_array(depth_map, rgb_img, output_path, max_points)
+
+    def depth_to_pointcloud_from_array(self, depth_map, rgb_img, output_path="output.ply",
+                                       max_points=MAX_EXPORT_POINTS):
+        """
+        Convert depth map and an already decoded RGB image to a colored point cloud.
+        Args:
+            depth_map (numpy.ndarray): Normalized depth map (H, W).
+            rgb_img (numpy.ndarray): RGB image (H, W, 3), uint8.
+            output_path (str): Path to save the point cloud (.ply or .obj).
+            max_points (int): Subsample to at most this many points (None keeps all).
+        Returns:
+            trimesh.PointCloud: The generated point cloud object.
+        """
+        try:
+            # float32 halves the memory traffic of the back-projection; MiDaS
+            # depth isn't more precise than that anyway
+            depth_map = np.ascontiguousarray(depth_map, dtype=np.float32)
             
-            # Ensure depth map and RGB image have the same resolution
-            if depth_map.shape[:2] != rgb_img.shape[:2]:
-                 depth_map = cv2.resize(depth_map, (rgb_img.shape[1], rgb_img.shape[0]))
+            # Bring depth map and RGB image to the same resolution by downscaling:
+            # the smaller of the two, capped at MAX_BACKPROJECT_HEIGHT
+            rgb_h, rgb_w = rgb_img.shape[:2]
+            scale = min(1.0, depth_map.shape[0] / rgb_h, MAX_BACKPROJECT_HEIGHT / rgb_h)
+            target_w, target_h = max(1, round(rgb_w * scale)), max(1, round(rgb_h * scale))
+            if (rgb_h, rgb_w) != (target_h, target_w):
+                rgb_img = cv2.resize(rgb_img, (target_w, target_h), interpolation=cv2.INTER_AREA)
+            if depth_map.shape[:2] != (target_h, target_w):
+                # Nearest neighbour is cheaper than bilinear and doesn't blend depths
+                # across object edges into points floating between them
+                depth_map = cv2.resize(depth_map, (target_w, target_h), interpolation=cv2.INTER_NEAREST)
 
             height, width = depth_map.shape
             
@@ -34,13 +144,10 @@ class PointCloudGenerator:
             # Assuming a standard field of view (approx 60 degrees)
             # fx = fy = width / (2 * tan(fov/2))
             fov = 60
-            fx = width / (2 * np.tan(np.radians(fov / 2)))
+            fx = np.float32(width / (2 * np.tan(np.radians(fov / 2))))
             fy = fx
-            cx = width / 2
-            cy = height / 2
-            
-            # Generate mesh grid
-            x, y = np.meshgrid(np.arange(width), np.arange(height))
+            cx = np.float32(width / 2)
+            cy = np.float32(height / 2)
             
             # Back-project to 3D
             # Z = depth (we need to invert or scale it appropriately)
@@ -53,27 +160,35 @@ class PointCloudGenerator:
             # Simple linear mapping for visualization if we treat it as distance (which is not strictly true for MiDaS but often used for simple effects)
             # Or use 1/d. Let's try 1/d with a scale.
             
-            epsilon = 1e-6
-            z = 1.0 / (depth_map + epsilon)
-            
-            # Clip Z to avoid flying pixels at infinity
-            z = np.clip(z, 0, 100) # Arbitrary scale
-            
             # X = (u - cx) * Z / fx
             # Y = (v - cy) * Z / fy
+            # Z is capped at 100 to avoid flying pixels at infinity (arbitrary scale)
+            vertices = np.empty((height * width, 3), dtype=np.float32)
+            backproject_depth(depth_map, vertices, fx, fy, cx, cy, np.float32(1e-6), np.float32(100))
+            # Still a view for a channel-reversed image: the pixel rows merge into
+            # one axis with a negative channel stride, and write_ply reads the
+            # channels one field at a time
+            colors = rgb_img.reshape(-1, 3).astype(np.uint8, copy=False)
             
-            x_3d = (x - cx) * z / fx
-            y_3d = (y - cy) * z / fy
+            if max_points and len(vertices) > max_points:
+                # Fixed seed so repeated runs export the same points
+                idx = np.random.default_rng(0).choice(len(vertices), max_points, replace=False)
+                idx.sort()
+                vertices = vertices[idx]
+                colors = colors[idx]
             
-            # Stack to (N, 3)
-            vertices = np.stack((x_3d.flatten(), y_3d.flatten(), z.flatten()), axis=1)
-            colors = rgb_img.reshape(-1, 3)
+            # trimesh is only needed for the returned object and non-PLY formats,
+            # so importing this module doesn't pay for it
+            import trimesh
             
             # Create PointCloud using trimesh
             pcd = trimesh.points.PointCloud(vertices=vertices, colors=colors)
             
-            # Save
-            pcd.export(output_path)
+            # Save; PLY is written directly from the arrays
+            if output_path.lower().endswith(".ply"):
+                write_ply(output_path, vertices, colors)
+            else:
+                pcd.export(output_path)
             print(f"Point cloud saved to {output_path}")
             
             return pcd
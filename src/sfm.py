@@ -1,8 +1,124 @@
+import os
+import hashlib
+import platform
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import cv2
 import numpy as np
-from typing import List, Dict, Tuple
+from typing import List, Dict, Optional, Tuple
 import trimesh
 
+from ._fast import ratio_filter
+from .point_cloud_generation import write_ply
+
+
+def _kp_xy(keypoints: List[cv2.KeyPoint]) -> np.ndarray:
+    """Convert keypoints to an (N, 2) float32 array of (x, y) coordinates."""
+    if len(keypoints) == 0:
+        return np.empty((0, 2), dtype=np.float32)
+    return cv2.KeyPoint_convert(keypoints).reshape(-1, 2)
+
+
+def _match_indices(matches: List[cv2.DMatch]) -> Tuple[np.ndarray, np.ndarray]:
+    """Collect (queryIdx, trainIdx) of all matches as two int32 arrays in a single pass."""
+    n = len(matches)
+    idx = np.fromiter((i for m in matches for i in (m.queryIdx, m.trainIdx)),
+                      dtype=np.int32, count=2 * n).reshape(n, 2)
+    return idx[:, 0], idx[:, 1]
+
+
+# Detector settings per feature type; part of the feature cache key, so
+# changing them invalidates cached features
+DETECTOR_PARAMS = {
+    "SIFT": {},
+    "ORB": {"nfeatures": 5000},
+    "AKAZE": {},
+    "CUDA_ORB": {"nfeatures": 5000},
+}
+
+# Bump when extraction changes in a way that alters cached features
+FEATURE_CACHE_VERSION = 2
+
+# Feature types producing binary (uint8) descriptors, matched by Hamming distance
+BINARY_FEATURE_TYPES = ("ORB", "CUDA_ORB", "AKAZE")
+
+# Threads in the feature extraction pool. Processes sharing the CPU with
+# others (e.g. web worker processes) should lower it with configure_feature_pool
+FEATURE_POOL_WORKERS = os.cpu_count() or 1
+
+# Images in flight at once on the CUDA path, each on its own stream: while the
+# GPU detects on one, the next is decoded and uploaded
+CUDA_PIPELINE_DEPTH = 2
+
+_cpu_dispatch_checked = False
+
+
+def _check_cpu_dispatch():
+    """
+    Enable OpenCV's optimized code paths and warn (once per process) if the
+    installed build has no AVX2 kernels, which SIFT's descriptor loops rely on.
+    Only x86-64 has AVX2; ARM builds (e.g. Apple Silicon) dispatch to NEON instead.
+    """
+    global _cpu_dispatch_checked
+    if _cpu_dispatch_checked:
+        return
+    _cpu_dispatch_checked = True
+    
+    cv2.setUseOptimized(True)
+    if platform.machine().lower() not in ("x86_64", "amd64"):
+        return
+    cpu_features = []
+    for line in cv2.getBuildInformation().splitlines():
+        line = line.strip()
+        if line.startswith(("Baseline:", "Dispatched code generation:")):
+            cpu_features.append(line)
+    if cpu_features and not any("AVX2" in line for line in cpu_features):
+        print("Warning: OpenCV was built without AVX2 dispatch; feature extraction will be slower. "
+              f"({'; '.join(cpu_features)})")
+
+
+_feature_pool = None
+_feature_pool_lock = threading.Lock()
+
+
+def _get_feature_pool() -> ThreadPoolExecutor:
+    """
+    Get the process-wide feature extraction pool (FEATURE_POOL_WORKERS threads).
+    Sharing it keeps concurrent reconstructions within a process from each
+    starting their own threads, and avoids pool start-up per call.
+    """
+    global _feature_pool
+    with _feature_pool_lock:
+        if _feature_pool is None:
+            _feature_pool = ThreadPoolExecutor(max_workers=FEATURE_POOL_WORKERS,
+                                               thread_name_prefix="sfm-features")
+        return _feature_pool
+
+
+def configure_feature_pool(workers: int) -> None:
+    """
+    Set the number of feature extraction threads for this process. An
+    existing pool is shut down so the next reconstruction starts a new one.
+    """
+    global FEATURE_POOL_WORKERS, _feature_pool
+    if workers < 1:
+        raise ValueError(f"workers must be at least 1, got {workers}")
+    with _feature_pool_lock:
+        FEATURE_POOL_WORKERS = workers
+        if _feature_pool is not None:
+            _feature_pool.shutdown(wait=False)
+            _feature_pool = None
+
+
+def cuda_available() -> bool:
+    """Return True if OpenCV was built with CUDA and a device is present."""
+    try:
+        return cv2.cuda.getCudaEnabledDeviceCount() > 0
+    except (AttributeError, cv2.error):
+        return False
+
+
 class SfMReconstructor:
     """
     Structure from Motion reconstructor for multi-view 3D reconstruction.
@@ -15,54 +131,117 @@ class SfMReconstructor:
     5. Dense point cloud generation
     """
     
-    def __init__(self, feature_type: str = "SIFT", matcher_type: str = "FLANN"):
+    def __init__(self, feature_type: str = "SIFT", matcher_type: str = "FLANN",
+                 cache_dir: Optional[str] = None, fast_mode: bool = False,
+                 use_opencl: bool = False):
         """
         Initialize the SfM reconstructor.
         
         Args:
-            feature_type: Type of feature detector ('SIFT', 'ORB', 'AKAZE')
-            matcher_type: Type of feature matcher ('FLANN', 'BF')
+            feature_type: Type of feature detector ('SIFT', 'ORB', 'AKAZE', 'CUDA_ORB').
+                          'CUDA_ORB' falls back to CPU 'ORB' when no CUDA device is found.
+            matcher_type: Type of feature matcher ('FLANN', 'BF', 'CASCADE').
+                          'CASCADE' uses wider multi-probe LSH hashing for binary
+                          descriptors, intended for large image sets.
+            cache_dir: Optional directory where extracted features are cached per
+                       image (keyed by path, detector and modification time).
+            fast_mode: Use ORB with brute-force Hamming matching instead of the given
+                       feature/matcher types. Binary descriptors are much cheaper to
+                       match than SIFT's 128 floats, at some cost in accuracy.
+            use_opencl: Pass images to the CPU detectors as cv2.UMat so OpenCV's
+                        T-API can run supported kernels on an OpenCL device.
+                        Ignored when OpenCL is unavailable.
         """
+        if fast_mode:
+            feature_type, matcher_type = "ORB", "BF"
+        if feature_type == "CUDA_ORB" and not cuda_available():
+            print("Warning: No CUDA device available, falling back to CPU ORB.")
+            feature_type = "ORB"
+        if matcher_type == "CASCADE" and feature_type not in BINARY_FEATURE_TYPES:
+            print(f"Warning: CASCADE hashing needs binary descriptors; {feature_type} "
+                  "features are matched with the FLANN KD-tree instead.")
         self.feature_type = feature_type
         self.matcher_type = matcher_type
+        self.cache_dir = cache_dir
+        self.use_umat = use_opencl and feature_type != "CUDA_ORB" and cv2.ocl.haveOpenCL()
+        if self.use_umat:
+            cv2.ocl.setUseOpenCL(True)
         self.detector = None
         self.matcher = None
+        self._local = threading.local()
+        # Projection matrix buffers reused across triangulate_points calls
+        self._P1 = None
+        self._P2_raw = np.empty((3, 4))
+        self._P2 = np.empty((3, 4))
         self._initialize_detectors()
         
-    def _initialize_detectors(self):
-        """Initialize feature detectors and matchers."""
-        # Initialize feature detector
+    def _create_detector(self):
+        """Create a new feature detector of the configured type."""
+        if self.feature_type not in DETECTOR_PARAMS:
+            raise ValueError(f"Unsupported feature type: {self.feature_type}")
+        params = DETECTOR_PARAMS[self.feature_type]
         if self.feature_type == "SIFT":
-            self.detector = cv2.SIFT_create()
+            return cv2.SIFT_create(**params)
         elif self.feature_type == "ORB":
-            self.detector = cv2.ORB_create(nfeatures=5000)
+            return cv2.ORB_create(**params)
         elif self.feature_type == "AKAZE":
-            self.detector = cv2.AKAZE_create()
+            return cv2.AKAZE_create(**params)
         else:
-            raise ValueError(f"Unsupported feature type: {self.feature_type}")
+            return cv2.cuda_ORB.create(**params)
+    
+    def _thread_detector(self):
+        """Get a detector owned by the calling thread (detectors aren't guaranteed thread-safe)."""
+        if threading.current_thread() is threading.main_thread():
+            return self.detector
+        detector = getattr(self._local, "detector", None)
+        if detector is None:
+            detector = self._local.detector = self._create_detector()
+        return detector
+        
+    def _initialize_detectors(self):
+        """Initialize feature detectors and matchers."""
+        _check_cpu_dispatch()
+        
+        # Initialize feature detector
+        self.detector = self._create_detector()
             
         # Initialize matcher
-        if self.matcher_type == "FLANN":
-            if self.feature_type == "ORB":
-                # ORB uses Hamming distance
-                FLANN_INDEX_LSH = 6
+        self.matcher = self._create_matcher()
+    
+    def _create_matcher(self):
+        """Create a new descriptor matcher of the configured type."""
+        binary_descriptors = self.feature_type in BINARY_FEATURE_TYPES
+        if self.matcher_type in ("FLANN", "CASCADE"):
+            FLANN_INDEX_LSH = 6
+            if binary_descriptors and self.matcher_type == "CASCADE":
+                # More, longer hash tables: fewer candidates per bucket
+                index_params = dict(algorithm=FLANN_INDEX_LSH,
+                                   table_number=12,
+                                   key_size=20,
+                                   multi_probe_level=2)
+            elif binary_descriptors:
+                # ORB/AKAZE use Hamming distance
                 index_params = dict(algorithm=FLANN_INDEX_LSH,
                                    table_number=6,
                                    key_size=12,
                                    multi_probe_level=1)
             else:
+                # FLANN's LSH only supports binary descriptors, so float
+                # descriptors stay on the KD-tree forest for CASCADE too
                 # SIFT uses L2 distance
                 FLANN_INDEX_KDTREE = 1
                 index_params = dict(algorithm=FLANN_INDEX_KDTREE, trees=5)
                 
             search_params = dict(checks=50)
-            self.matcher = cv2.FlannBasedMatcher(index_params, search_params)
+            return cv2.FlannBasedMatcher(index_params, search_params)
         else:
             # Brute force matcher
-            if self.feature_type == "ORB":
-                self.matcher = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=True)
+            if binary_descriptors:
+                return cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=True)
             else:
-                self.matcher = cv2.BFMatcher(cv2.NORM_L2, crossCheck=True)
+                # Float descriptors go through knnMatch + ratio test in
+                # match_features, and cross-checking only supports k=1
+                return cv2.BFMatcher(cv2.NORM_L2)
     
     def extract_features(self, image_path: str) -> Tuple[np.ndarray, np.ndarray]:
         """
@@ -74,19 +253,137 @@ class SfMReconstructor:
         Returns:
             Tuple of (keypoints, descriptors)
         """
-        image = cv2.imread(image_path)
-        if image is None:
-            raise ValueError(f"Could not read image: {image_path}")
-            
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        keypoints, descriptors = self.detector.detectAndCompute(gray, None)
+        cache_path = self._feature_cache_path(image_path)
+        cached = self._load_cached_features(cache_path)
+        if cached is not None:
+            return cached
+        
+        gray = self._read_gray(image_path)
+        detector = self._thread_detector()
+        if self.feature_type == "CUDA_ORB":
+            keypoints, descriptors = self._detect_and_compute_cuda(detector, gray)
+        elif self.use_umat:
+            keypoints, descriptors = detector.detectAndCompute(cv2.UMat(gray), None)
+            if isinstance(descriptors, cv2.UMat):
+                descriptors = descriptors.get()
+        else:
+            keypoints, descriptors = detector.detectAndCompute(gray, None)
         
+        return self._finish_features(cache_path, keypoints, descriptors)
+    
+    @staticmethod
+    def _read_gray(image_path: str) -> np.ndarray:
+        """Decode an image straight to grayscale, skipping the intermediate BGR image."""
+        gray = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+        if gray is None:
+            raise ValueError(f"Could not read image: {image_path}")
+        return gray
+    
+    def _load_cached_features(self, cache_path: Optional[str]):
+        """Return cached (keypoints, descriptors), or None on a miss or unreadable entry."""
+        if cache_path and os.path.exists(cache_path):
+            try:
+                return self._load_features(cache_path)
+            except Exception as e:
+                print(f"Warning: Ignoring unreadable feature cache {cache_path}: {e}")
+        return None
+    
+    def _finish_features(self, cache_path: Optional[str], keypoints, descriptors):
+        """Normalize an image without features to empty results and cache them."""
         if descriptors is None:
             descriptors = np.array([])
             keypoints = []
+        
+        if cache_path:
+            self._save_features(cache_path, keypoints, descriptors)
             
         return keypoints, descriptors
     
+    def _feature_cache_path(self, image_path: str) -> Optional[str]:
+        """Get the feature cache file for an image, or None if caching is disabled."""
+        if not self.cache_dir:
+            return None
+        abs_path = os.path.abspath(image_path)
+        try:
+            mtime = os.stat(abs_path).st_mtime_ns
+        except OSError:
+            return None
+        # Everything that changes the extracted features goes into the key
+        config = (f"{abs_path}|{self.feature_type}|{sorted(DETECTOR_PARAMS[self.feature_type].items())}"
+                  f"|opencl={self.use_umat}|v{FEATURE_CACHE_VERSION}")
+        key = hashlib.sha1(config.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, f"{key}_{mtime}.npz")
+    
+    def _save_features(self, cache_path: str, keypoints: List[cv2.KeyPoint], descriptors: np.ndarray):
+        """Write keypoints and descriptors to the feature cache."""
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                np.savez_compressed(
+                    f,
+                    xy=_kp_xy(keypoints),
+                    size=np.float32([kp.size for kp in keypoints]),
+                    angle=np.float32([kp.angle for kp in keypoints]),
+                    response=np.float32([kp.response for kp in keypoints]),
+                    octave=np.int32([kp.octave for kp in keypoints]),
+                    class_id=np.int32([kp.class_id for kp in keypoints]),
+                    descriptors=descriptors,
+                )
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            print(f"Warning: Could not write feature cache {cache_path}: {e}")
+    
+    def _prune_feature_cache(self, image_paths: List[str]):
+        """
+        Drop cache entries for older versions (modification times) of the given
+        images, with one scan of the cache directory.
+        """
+        current = {}
+        for image_path in image_paths:
+            cache_path = self._feature_cache_path(image_path)
+            if cache_path:
+                name = os.path.basename(cache_path)
+                current[name.rsplit("_", 1)[0]] = name
+        if not current:
+            return
+        try:
+            with os.scandir(self.cache_dir) as entries:
+                stale = [entry.path for entry in entries
+                         if entry.name.endswith(".npz")
+                         and current.get(entry.name.rsplit("_", 1)[0], entry.name) != entry.name]
+        except OSError:
+            return
+        for path in stale:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    
+    @staticmethod
+    def _load_features(cache_path: str) -> Tuple[List[cv2.KeyPoint], np.ndarray]:
+        """Read keypoints and descriptors from the feature cache."""
+        with np.load(cache_path) as data:
+            keypoints = [
+                cv2.KeyPoint(float(x), float(y), float(size), float(angle),
+                             float(response), int(octave), int(class_id))
+                for (x, y), size, angle, response, octave, class_id in zip(
+                    data["xy"], data["size"], data["angle"], data["response"],
+                    data["octave"], data["class_id"])
+            ]
+            descriptors = data["descriptors"]
+        return keypoints, descriptors
+    
+    @staticmethod
+    def _detect_and_compute_cuda(detector, gray: np.ndarray) -> Tuple[List[cv2.KeyPoint], np.ndarray]:
+        """Run a CUDA detector on a grayscale image and download the results."""
+        gpu_img = cv2.cuda_GpuMat()
+        gpu_img.upload(gray)
+        gpu_kp, gpu_desc = detector.detectAndComputeAsync(gpu_img, None)
+        keypoints = detector.convert(gpu_kp)
+        descriptors = gpu_desc.download() if not gpu_desc.empty() else None
+        return keypoints, descriptors
+    
     def match_features(self, desc1: np.ndarray, desc2: np.ndarray) -> List[cv2.DMatch]:
         """
         Match features between two sets of descriptors.
@@ -102,18 +399,10 @@ class SfMReconstructor:
             return []
             
         try:
-            if self.matcher_type == "FLANN" or self.feature_type == "SIFT":
+            if self.matcher_type in ("FLANN", "CASCADE") or self.feature_type == "SIFT":
                 # For k-NN matching with SIFT/FLANN
                 matches = self.matcher.knnMatch(desc1, desc2, k=2)
-                
-                # Apply Lowe's ratio test
-                good_matches = []
-                for match_pair in matches:
-                    if len(match_pair) == 2:
-                        m, n = match_pair
-                        if m.distance < 0.7 * n.distance:
-                            good_matches.append(m)
-                return good_matches
+                return self._ratio_test(matches)
             else:
                 # For BF matching (e.g. ORB with crossCheck=True)
                 matches = self.matcher.match(desc1, desc2)
@@ -124,26 +413,32 @@ class SfMReconstructor:
             print(f"Matching failed: {e}")
             return []
     
-    def estimate_poses(self, kp1: List[cv2.KeyPoint], kp2: List[cv2.KeyPoint], 
-                      matches: List[cv2.DMatch]) -> Tuple[np.ndarray, np.ndarray]:
+    @staticmethod
+    def _ratio_test(knn_matches, ratio: float = 0.7) -> List[cv2.DMatch]:
+        """Apply Lowe's ratio test to k=2 matches as one vectorized comparison."""
+        pairs = [p for p in knn_matches if len(p) == 2]
+        if not pairs:
+            return []
+        dists = np.fromiter((d for m, n in pairs for d in (m.distance, n.distance)),
+                            dtype=np.float32, count=2 * len(pairs)).reshape(-1, 2)
+        keep = ratio_filter(dists[:, 0], dists[:, 1], ratio)
+        return [pairs[i][0] for i in keep]
+    
+    def estimate_poses(self, pts1: np.ndarray, pts2: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
         """
         Estimate camera poses from matched features.
         
         Args:
-            kp1: Keypoints from first image
-            kp2: Keypoints from second image
-            matches: Matched features
+            pts1: (N, 2) matched point coordinates in the first image
+            pts2: (N, 2) matched point coordinates in the second image
             
         Returns:
-            Tuple of (rotation_matrix, translation_vector)
+            Tuple of (rotation_matrix, translation_vector, inlier_mask), where
+            inlier_mask is an (N,) boolean array of matches consistent with the pose
         """
-        if len(matches) < 8:
-            raise ValueError(f"Not enough matches for pose estimation: {len(matches)} < 8")
+        if len(pts1) < 8:
+            raise ValueError(f"Not enough matches for pose estimation: {len(pts1)} < 8")
 
-        # Extract matched points
-        pts1 = np.float32([kp1[m.queryIdx].pt for m in matches]).reshape(-1, 1, 2)
-        pts2 = np.float32([kp2[m.trainIdx].pt for m in matches]).reshape(-1, 1, 2)
-        
         # Find essential matrix
         # Assuming intrinsic matrix K is identity or estimated (here using placeholder K)
         K = self._get_camera_matrix()  
@@ -156,45 +451,52 @@ class SfMReconstructor:
             raise ValueError("Could not estimate essential matrix")
         
         # Recover pose
-        # We pass points to recoverPose to disambiguate the 4 possible solutions
-        points, R, t, mask = cv2.recoverPose(E, pts1, pts2, K)
+        # We pass points to recoverPose to disambiguate the 4 possible solutions;
+        # passing the RANSAC mask limits its output mask to inliers in front of both cameras
+        points, R, t, mask = cv2.recoverPose(E, pts1, pts2, K, mask=mask)
         
-        return R, t
+        return R, t, mask.ravel() > 0
     
-    def triangulate_points(self, kp1: List[cv2.KeyPoint], kp2: List[cv2.KeyPoint],
-                          matches: List[cv2.DMatch], R: np.ndarray, t: np.ndarray) -> np.ndarray:
+    def triangulate_points(self, pts1: np.ndarray, pts2: np.ndarray,
+                          R: np.ndarray, t: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
         """
         Triangulate 3D points from matched features and camera poses.
         
         Args:
-            kp1: Keypoints from first image
-            kp2: Keypoints from second image
-            matches: Matched features
+            pts1: (N, 2) matched point coordinates in the first image
+            pts2: (N, 2) matched point coordinates in the second image
             R: Rotation matrix
             t: Translation vector
             
         Returns:
-            Array of 3D points
+            Tuple of (array of finite 3D points, (N,) boolean mask of the
+            matches they came from). Points at infinity (w ~ 0) are dropped.
         """
         K = self._get_camera_matrix()
         
         # Projection matrices
-        # P1 is at origin [I|0]
-        P1 = np.dot(K, np.hstack((np.eye(3), np.zeros((3, 1)))))
-        # P2 is at [R|t]
-        P2 = np.dot(K, np.hstack((R, t)))
+        # P1 is at origin [I|0]; K is fixed, so it is computed once
+        if self._P1 is None:
+            self._P1 = np.dot(K, np.hstack((np.eye(3), np.zeros((3, 1)))))
+        P1 = self._P1
+        # P2 is at [R|t], filled into preallocated buffers
+        self._P2_raw[:, :3] = R
+        self._P2_raw[:, 3:] = np.reshape(t, (3, 1))
+        P2 = np.matmul(K, self._P2_raw, out=self._P2)
         
-        # Extract matched points
-        pts1 = np.float32([kp1[m.queryIdx].pt for m in matches]).T
-        pts2 = np.float32([kp2[m.trainIdx].pt for m in matches]).T
+        if len(pts1) == 0:
+            return np.empty((0, 3)), np.zeros(0, dtype=bool)
         
         # Triangulate
-        points_4d = cv2.triangulatePoints(P1, P2, pts1, pts2)
+        points_4d = cv2.triangulatePoints(P1, P2, pts1.T, pts2.T)
         
-        # Convert to 3D (homogeneous to euclidean)
-        points_3d = points_4d[:3] / points_4d[3]
+        # Convert to 3D (homogeneous to euclidean), skipping points at infinity
+        # so no NaN/inf values reach the point cloud
+        w = points_4d[3]
+        valid = np.abs(w) > 1e-9
+        points_3d = points_4d[:3, valid] / w[valid]
         
-        return points_3d.T
+        return points_3d.T, valid
     
     def reconstruct_from_images(self, image_paths: List[str]) -> Dict:
         """
@@ -213,11 +515,11 @@ class SfMReconstructor:
             return {"success": False, "error": "Need at least 2 images for SfM"}
         
         try:
-            # Extract features from all images
-            features = []
-            for path in image_paths:
-                kp, desc = self.extract_features(path)
-                features.append((kp, desc))
+            # Extract features from all images. OpenCV releases the GIL inside
+            # detectAndCompute, so threads give real parallelism here
+            features = self._extract_all_features(image_paths)
+            if self.cache_dir:
+                self._prune_feature_cache(image_paths)
             
             # For now, just process the first image pair
             kp1, desc1 = features[0]
@@ -233,26 +535,39 @@ class SfMReconstructor:
                     "fallback_needed": True
                 }
             
+            # Gather matched point coordinates with one array index per image
+            q_idx, t_idx = _match_indices(matches)
+            pts1 = _kp_xy(kp1)[q_idx]
+            pts2 = _kp_xy(kp2)[t_idx]
+            
             # Estimate poses
-            R, t = self.estimate_poses(kp1, kp2, matches)
+            R, t, inliers = self.estimate_poses(pts1, pts2)
+            
+            num_inliers = int(np.count_nonzero(inliers))
+            if num_inliers < 8:
+                return {
+                    "success": False,
+                    "error": f"Too few pose inliers: {num_inliers}",
+                    "fallback_needed": True
+                }
+            
+            # Only triangulate RANSAC inliers; outliers would just add noise
+            pts1 = pts1[inliers]
+            pts2 = pts2[inliers]
             
             # Triangulate points
-            points_3d = self.triangulate_points(kp1, kp2, matches, R, t)
+            points_3d, valid = self.triangulate_points(pts1, pts2, R, t)
+            pts1 = pts1[valid]
             
             # Get colors for 3D points
-            img1 = cv2.imread(image_paths[0])
-            img1_rgb = cv2.cvtColor(img1, cv2.COLOR_BGR2RGB)
-            
-            colors = []
-            for m in matches:
-                pt = kp1[m.queryIdx].pt
-                x, y = int(pt[0]), int(pt[1])
-                # Ensure coordinates are within bounds
-                x = max(0, min(x, img1_rgb.shape[1] - 1))
-                y = max(0, min(y, img1_rgb.shape[0] - 1))
-                colors.append(img1_rgb[y, x])
+            # BGR -> RGB as a reversed-channel view; only the gathered pixels are copied
+            img1_rgb = cv2.imread(image_paths[0])[..., ::-1]
             
-            colors = np.array(colors)
+            # Ensure coordinates are within bounds
+            h, w = img1_rgb.shape[:2]
+            xs = pts1[:, 0].astype(np.int32).clip(0, w - 1)
+            ys = pts1[:, 1].astype(np.int32).clip(0, h - 1)
+            colors = img1_rgb[ys, xs]
             
             return {
                 "success": True,
@@ -260,6 +575,7 @@ class SfMReconstructor:
                 "colors": colors,
                 "num_images": len(image_paths),
                 "num_matches": len(matches),
+                "num_inliers": num_inliers,
                 "cameras": [
                     {"rotation": np.eye(3), "translation": np.zeros(3)},
                     {"rotation": R, "translation": t.flatten()}
@@ -273,6 +589,59 @@ class SfMReconstructor:
                 "fallback_needed": True
             }
     
+    def _extract_all_features(self, image_paths: List[str]) -> List[Tuple[List[cv2.KeyPoint], np.ndarray]]:
+        """Extract features from several images concurrently, preserving input order."""
+        if self.feature_type == "CUDA_ORB":
+            return self._extract_all_features_cuda(image_paths)
+        if len(image_paths) < 2:
+            return [self.extract_features(path) for path in image_paths]
+        return list(_get_feature_pool().map(self.extract_features, image_paths))
+    
+    def _extract_all_features_cuda(self, image_paths: List[str]) -> List[Tuple[List[cv2.KeyPoint], np.ndarray]]:
+        """
+        Extract CUDA features for several images, keeping the GPU busy.
+        
+        Each image is uploaded and detected asynchronously on one of
+        CUDA_PIPELINE_DEPTH streams, and its results are downloaded only once
+        the next image is queued, so decoding the next image and downloading
+        the previous one overlap with detection. Every stream has its own
+        detector, since a cuda_ORB instance keeps per-call device buffers.
+        """
+        free_slots = deque((self._create_detector(), cv2.cuda_Stream())
+                           for _ in range(CUDA_PIPELINE_DEPTH))
+        in_flight = deque()
+        results = [None] * len(image_paths)
+        
+        def finish_oldest():
+            i, cache_path, slot, gpu_img, gpu_kp, gpu_desc = in_flight.popleft()
+            detector, stream = slot
+            stream.waitForCompletion()
+            keypoints = detector.convert(gpu_kp)
+            descriptors = gpu_desc.download() if not gpu_desc.empty() else None
+            results[i] = self._finish_features(cache_path, keypoints, descriptors)
+            free_slots.append(slot)
+        
+        for i, image_path in enumerate(image_paths):
+            cache_path = self._feature_cache_path(image_path)
+            cached = self._load_cached_features(cache_path)
+            if cached is not None:
+                results[i] = cached
+                continue
+            gray = self._read_gray(image_path)
+            if not free_slots:
+                finish_oldest()
+            slot = free_slots.popleft()
+            detector, stream = slot
+            gpu_img = cv2.cuda_GpuMat()
+            gpu_img.upload(gray, stream)
+            gpu_kp, gpu_desc = detector.detectAndComputeAsync(gpu_img, None, stream=stream)
+            # gpu_img stays referenced until the stream is done with it
+            in_flight.append((i, cache_path, slot, gpu_img, gpu_kp, gpu_desc))
+        
+        while in_flight:
+            finish_oldest()
+        return results
+    
     def _get_camera_matrix(self) -> np.ndarray:
         """Get default camera matrix (approximate)."""
         # Default camera matrix for 640x480 image
@@ -300,9 +669,9 @@ class SfMReconstructor:
         points = reconstruction_result["points_3d"]
         colors = reconstruction_result["colors"]
         
-        # Filter out points that are too far or have invalid coordinates
-        valid_mask = np.all(np.isfinite(points), axis=1)
-        valid_mask &= np.linalg.norm(points, axis=1) < 100  # Remove outliers
+        # Filter out points that are too far (triangulation already dropped
+        # points at infinity)
+        valid_mask = np.linalg.norm(points, axis=1) < 100  # Remove outliers
         
         points = points[valid_mask]
         colors = colors[valid_mask]
@@ -311,6 +680,10 @@ class SfMReconstructor:
         pcd = trimesh.PointCloud(vertices=points, colors=colors)
         
         if output_path:
-            pcd.export(output_path)
+            if output_path.lower().endswith(".ply"):
+                # Write the PLY directly instead of going through trimesh's exporter
+                write_ply(output_path, points, colors)
+            else:
+                pcd.export(output_path)
             
         return pcd
\ No newline at end of file
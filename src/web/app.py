@@ -2,13 +2,21 @@
 import os
 import uuid
 import time
+import json
 import shutil
+import hashlib
 import logging
-from concurrent.futures import ThreadPoolExecutor
-from flask import Flask, request, jsonify, send_from_directory, render_template
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from flask import Flask, request, jsonify, send_from_directory, render_template, make_response, abort
 from werkzeug.utils import secure_filename
+from werkzeug.security import safe_join
 from flask_cors import CORS
 from PIL import Image
+import numpy as np
+import torch
 
 # Import our core logic
 import sys
@@ -17,14 +25,21 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../'
 
 from src.depth_estimation import DepthEstimator
 from src.point_cloud_generation import PointCloudGenerator
+from src import sfm
 from src.sfm import SfMReconstructor
 
 # Configuration
 UPLOAD_FOLDER = os.path.abspath('uploads')
 RESULTS_FOLDER = os.path.abspath('results')
+DEPTH_CACHE_FOLDER = os.path.join(RESULTS_FOLDER, '_depth_cache')
+DEPTH_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024  # least recently used depth maps beyond this are pruned at startup
+DEPTH_MODEL = 'MiDaS_small'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'ply'}
 MAX_CONTENT_LENGTH = 50 * 1024 * 1024  # Increased to 50MB for PLY files
 MAX_FILE_SIZE = 50 * 1024 * 1024 # 50MB per file strict check
+# When served behind nginx, set this to an internal location aliased to the
+# results folder (e.g. /_internal_results/) so nginx streams downloads itself
+ACCEL_REDIRECT_PREFIX = os.environ.get('ACCEL_REDIRECT_PREFIX')
 
 # Initialize Flask
 app = Flask(__name__)
@@ -36,34 +51,223 @@ CORS(app)
 # Ensure directories exist
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(RESULTS_FOLDER, exist_ok=True)
+os.makedirs(DEPTH_CACHE_FOLDER, exist_ok=True)
 
 # Logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# Task Queue (Simple in-memory for demo)
-executor = ThreadPoolExecutor(max_workers=2) # Increased workers
-tasks = {}
+# Task Queue
+TASK_TTL = 3600  # seconds a task record is kept in Redis
 
-def validate_image(stream):
+class MemoryTaskStore:
+    """Task records in a process-local dict (single server process only)."""
+    shared = False
+
+    def __init__(self):
+        self._tasks = {}
+
+    def create(self, task_id, task):
+        self._tasks[task_id] = dict(task)
+
+    def update(self, task_id, **fields):
+        self._tasks.setdefault(task_id, {}).update(fields)
+
+    def get(self, task_id):
+        return self._tasks.get(task_id)
+
+class RedisTaskStore:
     """
-    Strictly validate image using PIL.
-    Returns (is_valid, error_message)
+    Task records as Redis hashes (one per task, JSON-encoded fields), so any
+    server or worker process can read and update them.
     """
+    shared = True
+
+    def __init__(self, url):
+        import redis
+        self._redis = redis.Redis.from_url(url, decode_responses=True)
+
+    def _key(self, task_id):
+        return f"task:{task_id}"
+
+    def create(self, task_id, task):
+        self.update(task_id, **task)
+
+    def update(self, task_id, **fields):
+        key = self._key(task_id)
+        pipe = self._redis.pipeline()
+        pipe.hset(key, mapping={k: json.dumps(v) for k, v in fields.items()})
+        pipe.expire(key, TASK_TTL)
+        pipe.execute()
+
+    def get(self, task_id):
+        task = self._redis.hgetall(self._key(task_id))
+        if not task:
+            return None
+        return {k: json.loads(v) for k, v in task.items()}
+
+def create_task_store():
+    """Use Redis when REDIS_URL is set, otherwise keep tasks in memory."""
+    redis_url = os.environ.get('REDIS_URL')
+    if redis_url:
+        try:
+            return RedisTaskStore(redis_url)
+        except ImportError:
+            logger.warning("REDIS_URL is set but the redis package is not installed; keeping tasks in memory")
+    return MemoryTaskStore()
+
+tasks = create_task_store()
+
+# Models shared by the tasks a worker process runs: loading MiDaS takes far
+# longer than running it
+_depth_estimator = None
+_depth_lock = threading.Lock()
+# SfMReconstructor keeps per-call scratch buffers, so each worker thread gets its own
+_sfm_local = threading.local()
+
+def get_depth_estimator():
+    """Return the shared DepthEstimator, loading the model on first use."""
+    global _depth_estimator
+    with _depth_lock:
+        if _depth_estimator is None:
+            _depth_estimator = DepthEstimator(model_type=DEPTH_MODEL)
+        return _depth_estimator
+
+def get_sfm_reconstructor():
+    """Return the calling worker thread's SfMReconstructor."""
+    reconstructor = getattr(_sfm_local, 'reconstructor', None)
+    if reconstructor is None:
+        reconstructor = _sfm_local.reconstructor = SfMReconstructor(feature_type="SIFT", matcher_type="FLANN")
+    return reconstructor
+
+def warm_up_models():
+    """Load the depth model ahead of the first request."""
     try:
-        img = Image.open(stream)
-        img.verify() # Verify file integrity
-        
-        # Reset stream position after verify
-        stream.seek(0)
+        get_depth_estimator()
+        logger.info("Depth model loaded")
+    except Exception as e:
+        logger.warning(f"Depth model warm-up failed: {e}")
+
+# Depth estimation and SfM are CPU heavy and partly GIL-bound, so tasks run in
+# worker processes; each worker loads its models once when it starts
+WORKER_PROCESSES = 2
+
+def init_worker():
+    """
+    Give each worker process its share of the CPUs, so concurrent tasks don't
+    each start cpu_count torch and feature extraction threads, then load models.
+    """
+    threads = max(1, (os.cpu_count() or 1) // WORKER_PROCESSES)
+    torch.set_num_threads(threads)
+    sfm.configure_feature_pool(threads)
+    warm_up_models()
+
+def _create_executor():
+    return ProcessPoolExecutor(max_workers=WORKER_PROCESSES, initializer=init_worker)
+
+executor = _create_executor()
+_executor_lock = threading.Lock()
+
+def _replace_broken_executor(broken):
+    """
+    Swap in a fresh pool when a worker died (e.g. OOM-killed); a
+    ProcessPoolExecutor rejects all further work once any worker is lost.
+    """
+    global executor
+    with _executor_lock:
+        if executor is broken:
+            logger.warning("Worker pool is broken, starting a new one")
+            broken.shutdown(wait=False)
+            executor = _create_executor()
+        return executor
+
+def submit_task(task_id, file_paths):
+    """Queue process_task on the worker pool, restarting the pool if it is broken."""
+    pool = executor
+    try:
+        future = pool.submit(process_task, task_id, file_paths)
+    except BrokenProcessPool:
+        pool = _replace_broken_executor(pool)
+        future = pool.submit(process_task, task_id, file_paths)
+    future.add_done_callback(partial(finish_task, task_id, pool))
+
+def _depth_cache_path(image_path):
+    """Depth cache file for an image, keyed by the SHA-256 of its contents."""
+    digest = hashlib.sha256()
+    with open(image_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return os.path.join(DEPTH_CACHE_FOLDER, f"{digest.hexdigest()}_{DEPTH_MODEL}.npy")
+
+def estimate_depth_cached(image_path):
+    """
+    Estimate depth for an image, reusing the result for identical image files.
+    Maps are stored as float16, plenty for a normalized MiDaS depth map; fresh
+    maps are rounded the same way so repeated uploads give identical clouds.
+    """
+    cache_path = _depth_cache_path(image_path)
+    try:
+        depth_map = np.load(cache_path)
+        os.utime(cache_path)  # mark as recently used
+        return depth_map.astype(np.float32)
+    except (OSError, ValueError):
+        pass
         
-        # Check format
-        if img.format.lower() not in ['jpeg', 'png', 'jpg']:
-             return False, f"Invalid image format: {img.format}"
+    estimator = get_depth_estimator()
+    depth_map = estimator.estimate_depth(image_path)
+    # Never cache the placeholder maps produced when the model failed to load
+    if depth_map is not None and estimator.model is not None:
+        depth_map = depth_map.astype(np.float16)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                np.save(f, depth_map)
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            logger.warning(f"Could not cache depth map: {e}")
+        depth_map = depth_map.astype(np.float32)
+    return depth_map
+
+def prune_depth_cache(max_bytes=DEPTH_CACHE_MAX_BYTES):
+    """
+    Delete the least recently used cached depth maps once their total size
+    exceeds max_bytes (maps are full resolution, so their sizes vary widely).
+    """
+    try:
+        with os.scandir(DEPTH_CACHE_FOLDER) as it:
+            entries = [(e.path, e.stat()) for e in it if e.is_file()]
+    except OSError:
+        return
+    entries.sort(key=lambda e: e[1].st_mtime, reverse=True)
+    total = 0
+    for path, st in entries:
+        total += st.st_size
+        if total > max_bytes:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+def validate_image(filepath):
+    """
+    Strictly validate a saved image file using PIL.
+    Returns (is_valid, error_message)
+    """
+    try:
+        # Image.open only parses the header from the saved file; the handle is
+        # closed right away instead of waiting for garbage collection
+        with Image.open(filepath) as img:
+            # Check format before paying for the full integrity check
+            if img.format.lower() not in ['jpeg', 'png', 'jpg']:
+                 return False, f"Invalid image format: {img.format}"
+                 
+            img.verify() # Verify file integrity
              
         return True, None
     except Exception as e:
-        return False, f"Corrupted or invalid image file: {str(e)}"
+        # Don't leak the server-side upload path to the client
+        message = str(e).replace(filepath, os.path.basename(filepath))
+        return False, f"Corrupted or invalid image file: {message}"
 
 def allowed_file(filename):
     return '.' in filename and \
@@ -79,36 +283,57 @@ def scan_file(filepath):
     return True
 
 def process_task(task_id, file_paths):
-    """Background task to process images to 3D."""
-    tasks[task_id]['status'] = 'processing'
+    """
+    Background task to process images to 3D.
+    Runs in a worker process and returns the fields to merge into the task
+    record; only a shared task store can be updated from here directly.
+    """
+    # The in-memory store lives in the server process, so there tasks go
+    # straight from 'queued' to their final status
+    if tasks.shared:
+        tasks.update(task_id, status='processing')
+    outcome = {}
     output_filename = f"{task_id}.ply"
     output_path = os.path.join(RESULTS_FOLDER, output_filename)
     
     try:
         start_time = time.time()
         
+        # Virus Scan first (kept off the upload request path; files are scanned concurrently)
+        with ThreadPoolExecutor(max_workers=min(8, len(file_paths))) as scan_pool:
+            scan_results = list(scan_pool.map(scan_file, file_paths))
+        rejected = [p for p, ok in zip(file_paths, scan_results) if not ok]
+        if rejected:
+            # Never keep files that failed the scan
+            for path in rejected:
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    logger.error(f"Task {task_id}: could not remove rejected file {path}: {e}")
+            raise Exception(f"安全检查未通过: {', '.join(os.path.basename(p) for p in rejected)}")
+        
         # 0. Check if Direct PLY Upload
         if len(file_paths) == 1 and file_paths[0].lower().endswith('.ply'):
              shutil.copy(file_paths[0], output_path)
-             tasks[task_id]['status'] = 'completed'
-             tasks[task_id]['result'] = output_filename
-             tasks[task_id]['method'] = 'upload'
+             outcome['status'] = 'completed'
+             outcome['result'] = output_filename
+             outcome['method'] = 'upload'
              logger.info(f"Task {task_id}: PLY Upload success")
-             return
+             return outcome
 
         # 1. Decision: SfM or Monocular
         if len(file_paths) >= 2:
             logger.info(f"Task {task_id}: Attempting SfM with {len(file_paths)} images")
-            reconstructor = SfMReconstructor(feature_type="SIFT")
+            reconstructor = get_sfm_reconstructor()
             result = reconstructor.reconstruct_from_images(file_paths)
             
             if result["success"]:
                 reconstructor.create_point_cloud(result, output_path)
-                tasks[task_id]['status'] = 'completed'
-                tasks[task_id]['result'] = output_filename
-                tasks[task_id]['method'] = 'sfm'
+                outcome['status'] = 'completed'
+                outcome['result'] = output_filename
+                outcome['method'] = 'sfm'
                 logger.info(f"Task {task_id}: SfM success")
-                return
+                return outcome
             else:
                 logger.warning(f"Task {task_id}: SfM failed ({result.get('error')}), falling back to monocular")
         
@@ -117,8 +342,7 @@ def process_task(task_id, file_paths):
         # Use the first image
         input_image = file_paths[0]
         
-        estimator = DepthEstimator(model_type='MiDaS_small')
-        depth_map = estimator.estimate_depth(input_image)
+        depth_map = estimate_depth_cached(input_image)
         
         if depth_map is None:
              raise Exception("深度估计失败")
@@ -127,20 +351,32 @@ def process_task(task_id, file_paths):
         pcd = generator.depth_to_pointcloud(depth_map, input_image, output_path)
         
         if pcd:
-            tasks[task_id]['status'] = 'completed'
-            tasks[task_id]['result'] = output_filename
-            tasks[task_id]['method'] = 'monocular'
+            outcome['status'] = 'completed'
+            outcome['result'] = output_filename
+            outcome['method'] = 'monocular'
             logger.info(f"Task {task_id}: Monocular success")
         else:
             raise Exception("点云生成失败")
             
     except Exception as e:
         logger.error(f"Task {task_id} failed: {e}")
-        tasks[task_id]['status'] = 'failed'
-        tasks[task_id]['error'] = str(e)
+        outcome['status'] = 'failed'
+        outcome['error'] = str(e)
     finally:
         # Cleanup uploaded files? keeping them for debug for now
         pass
+    return outcome
+
+def finish_task(task_id, pool, future):
+    """Merge a finished process_task outcome into the task record."""
+    try:
+        tasks.update(task_id, **future.result())
+    except Exception as e:
+        # The worker process itself failed (e.g. it was killed)
+        logger.error(f"Task {task_id} failed: {e}")
+        tasks.update(task_id, status='failed', error=str(e))
+        if isinstance(e, BrokenProcessPool):
+            _replace_broken_executor(pool)
 
 @app.route('/')
 def index():
@@ -173,41 +409,34 @@ def upload_files():
             errors.append(f"{filename}: 不支持的文件类型")
             continue
             
-        # 2. Check Magic Numbers / Content
-        if filename.lower().endswith('.ply'):
-             # Basic PLY validation (read first few bytes)
-             try:
-                 header = file.read(3)
-                 file.seek(0)
-                 if header != b'ply':
-                     errors.append(f"{filename}: 无效的 PLY 文件头")
-                     continue
-             except:
-                 errors.append(f"{filename}: 无法读取文件")
-                 continue
-        else:
-            is_valid, error_msg = validate_image(file.stream)
-            if not is_valid:
-                errors.append(f"{filename}: {error_msg}")
-                continue
-            
-        # 3. Save
+        # 2. Save (streamed to disk; everything below reads the saved file
+        # instead of consuming the upload stream several times)
         filepath = os.path.join(task_dir, filename)
         try:
             file.save(filepath)
             
-            # 4. Check Size (Double check actual saved size)
+            # 3. Check Size (Double check actual saved size)
             if os.path.getsize(filepath) > MAX_FILE_SIZE:
                 os.remove(filepath)
                 errors.append(f"{filename}: 文件过大 (最大 10MB)")
                 continue
                 
-            # 5. Virus Scan
-            if not scan_file(filepath):
-                 os.remove(filepath)
-                 errors.append(f"{filename}: 安全检查未通过")
-                 continue
-                 
+            # 4. Check Magic Numbers / Content
+            if filename.lower().endswith('.ply'):
+                # Basic PLY validation (read first few bytes)
+                with open(filepath, 'rb') as f:
+                    header = f.read(3)
+                if header != b'ply':
+                    os.remove(filepath)
+                    errors.append(f"{filename}: 无效的 PLY 文件头")
+                    continue
+            else:
+                is_valid, error_msg = validate_image(filepath)
+                if not is_valid:
+                    os.remove(filepath)
+                    errors.append(f"{filename}: {error_msg}")
+                    continue
+                
             saved_paths.append(filepath)
             
         except Exception as e:
@@ -219,16 +448,16 @@ def upload_files():
         return jsonify({'error': '所有文件均上传失败', 'details': errors}), 400
         
     # Create task
-    tasks[task_id] = {
+    tasks.create(task_id, {
         'id': task_id,
         'status': 'queued',
         'submitted_at': time.time(),
         'files': len(saved_paths),
         'warnings': errors if errors else None
-    }
+    })
     
     # Submit to background executor
-    executor.submit(process_task, task_id, saved_paths)
+    submit_task(task_id, saved_paths)
     
     response_data = {
         'message': '上传成功，开始处理', 
@@ -250,6 +479,16 @@ def get_status(task_id):
 
 @app.route('/api/download/<filename>', methods=['GET'])
 def download_result(filename):
+    if ACCEL_REDIRECT_PREFIX:
+        path = safe_join(app.config['RESULTS_FOLDER'], filename)
+        if path is None or not os.path.isfile(path):
+            abort(404)
+        # Empty body; nginx sends the file from disk with sendfile
+        resp = make_response('')
+        resp.headers['X-Accel-Redirect'] = ACCEL_REDIRECT_PREFIX.rstrip('/') + '/' + filename
+        resp.headers['Content-Disposition'] = f'attachment; filename={filename}'
+        resp.headers['Content-Type'] = 'application/octet-stream'
+        return resp
     return send_from_directory(app.config['RESULTS_FOLDER'], filename, as_attachment=True)
 
 @app.errorhandler(413)
@@ -260,4 +499,8 @@ if __name__ == '__main__':
     # Use FLASK_DEBUG environment variable, default to True for dev
     debug_mode = os.environ.get('FLASK_DEBUG', 'True').lower() in ['true', '1', 't']
     port = int(os.environ.get('PORT', 5000))
+    # Only in the serving process when the debug reloader is active; workers
+    # load their models in init_worker
+    if not debug_mode or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        prune_depth_cache()
     app.run(debug=debug_mode, host='0.0.0.0', port=port)